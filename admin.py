@@ -1,9 +1,19 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from database import Order, OrderStatus, User, Payment, PaymentStatus, Message, Review
+from telegram.error import RetryAfter, TimedOut
+from database import (
+    Order, OrderStatus, User, Payment, PaymentStatus, Message, Review,
+    BroadcastJob, BroadcastRecipient, BroadcastStatus
+)
+from collections import Counter
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, insert, literal, select, update as sa_update
+from sqlalchemy.orm import joinedload
+import asyncio
 import logging
+import re
+import time
+from functools import lru_cache, wraps
 from states import (
     WAITING_BROADCAST,
     WAITING_REVIEW_RESPONSE,
@@ -23,110 +33,275 @@ ORDER_STATUS_MESSAGES = {
     OrderStatus.CANCELLED: "❌ Отменен"
 }
 
-def get_admin_keyboard():
-    """Возвращает клавиатуру админ-панели."""
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("📥 Новые заказы", callback_data='admin_new_orders')],
-        [InlineKeyboardButton("📊 Статистика", callback_data='admin_stats')],
-        [InlineKeyboardButton("📢 Рассылка", callback_data='admin_broadcast')],
-        [InlineKeyboardButton("⭐ Отзывы", callback_data='admin_reviews')],
-        [InlineKeyboardButton("📨 Сообщения", callback_data='admin_messages')]
-    ])
-
-def get_order_keyboard(order_id: int):
-    """Возвращает клавиатуру для управления заказом."""
-    return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("✅ Принять", callback_data=f'admin_accept_{order_id}'),
-            InlineKeyboardButton("❌ Отклонить", callback_data=f'admin_reject_{order_id}')
-        ],
-        [InlineKeyboardButton("💬 Написать", callback_data=f'admin_message_{order_id}')]
-    ])
+# Подписи статусов в порядке объявления OrderStatus и индекс статуса в этом порядке
+STATUS_LABELS = tuple(ORDER_STATUS_MESSAGES[status] for status in OrderStatus)
+STATUS_INDEX = {status: index for index, status in enumerate(OrderStatus)}
+
+# Лимиты рассылки: Telegram допускает около 30 сообщений в секунду
+BROADCAST_BATCH_SIZE = 30
+BROADCAST_BATCH_INTERVAL = 1.05
+BROADCAST_PROGRESS_BATCHES = 10  # Как часто обновлять отчёт о ходе рассылки
+
+# Время жизни кэша статистики, секунды
+STATS_CACHE_TTL = 30
+
+# Повторное нажатие той же кнопки в течение этого времени игнорируется, секунды
+DEBOUNCE_TTL = 2.0
+RECENT_CALLBACKS = {}
+
+# Количество элементов на одной странице списков админ-панели. Элемент с
+# обрезанными полями занимает не больше ~750 символов, поэтому страница
+# гарантированно укладывается в ADMIN_MESSAGE_LIMIT
+ADMIN_PAGE_SIZE = 5
+
+# Предел длины страницы: Telegram не принимает сообщения длиннее 4096 символов
+ADMIN_MESSAGE_LIMIT = 4000
+
+# Разбор callback_data кнопок админ-панели
+ORDER_CALLBACK = re.compile(r'admin_(?:accept|reject|message)_(\d+)$')
+RESPONSE_CALLBACK = re.compile(r'admin_(?:review|message)_response_(\d+)$')
+PAGE_CALLBACK = re.compile(r'_page_(\d+)$')
+
+# Не чаще одного уведомления в секунду в один чат
+CHAT_SEND_INTERVAL = 1.0
+CHAT_LAST_SEND = {}
+
+# Постоянные тексты ответов админ-панели
+ADMIN_PANEL_TEXT = "👨‍💼 Панель администратора\n\nВыберите действие:"
+DENY = "⛔ У вас нет доступа к админ-панели."
+NO_ORDERS = "📭 Новых заказов нет."
+NO_REVIEWS = "📭 Отзывов пока нет."
+NO_MESSAGES = "📭 Сообщений пока нет."
+ORDER_NOT_FOUND = "❌ Заказ не найден."
+ORDER_NOT_FOUND_ERROR = "❌ Ошибка: заказ не найден."
+USER_NOT_FOUND = "❌ Пользователь не найден."
+REVIEW_NOT_FOUND = "❌ Отзыв не найден."
+REVIEW_NOT_FOUND_ERROR = "❌ Ошибка: отзыв не найден."
+MESSAGE_NOT_FOUND = "❌ Сообщение не найдено."
+MESSAGE_NOT_FOUND_ERROR = "❌ Ошибка: сообщение не найдено."
+PRICE_NOT_POSITIVE = "❌ Цена должна быть больше нуля. Попробуйте еще раз:"
+INVALID_PRICE = "❌ Пожалуйста, введите корректную сумму:"
+BROADCAST_PROMPT = "📢 Введите сообщение для рассылки:"
+REVIEW_RESPONSE_PROMPT = "💬 Введите ответ на отзыв:"
+MESSAGE_RESPONSE_PROMPT = "💬 Введите ответ на сообщение:"
+REVIEW_RESPONSE_SAVED = "✅ Ответ на отзыв сохранен."
+MESSAGE_RESPONSE_SAVED = "✅ Ответ на сообщение сохранен."
+REJECT_ERROR = "❌ Произошла ошибка при отклонении заказа."
+STATS_ERROR = "❌ Произошла ошибка при получении статистики."
+BROADCAST_ERROR = "❌ Произошла ошибка при рассылке."
+REVIEWS_ERROR = "❌ Произошла ошибка при получении отзывов."
+MESSAGES_ERROR = "❌ Произошла ошибка при получении сообщений."
+RESPONSE_SAVE_ERROR = "❌ Произошла ошибка при сохранении ответа."
+
+# Клавиатура админ-панели не меняется, поэтому создаётся один раз
+ADMIN_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📥 Новые заказы", callback_data='admin_new_orders')],
+    [InlineKeyboardButton("📊 Статистика", callback_data='admin_stats')],
+    [InlineKeyboardButton("📢 Рассылка", callback_data='admin_broadcast')],
+    [InlineKeyboardButton("⭐ Отзывы", callback_data='admin_reviews')],
+    [InlineKeyboardButton("📨 Сообщения", callback_data='admin_messages')]
+])
+
+# Кнопки управления заказом: (текст, префикс callback_data)
+ORDER_BUTTONS = (
+    ("✅ Принять", 'admin_accept'),
+    ("❌ Отклонить", 'admin_reject')
+)
+
+def get_order_buttons(order_id: int):
+    """Возвращает ряд кнопок для управления заказом в списке."""
+    return [
+        InlineKeyboardButton(f"{text} #{order_id}", callback_data=f'{prefix}_{order_id}')
+        for text, prefix in ORDER_BUTTONS
+    ]
+
+@lru_cache(maxsize=4096)
+def get_pay_keyboard(order_id: int):
+    """Возвращает клавиатуру клиента с кнопкой оплаты заказа."""
+    return InlineKeyboardMarkup([[InlineKeyboardButton("Оплатить", callback_data=f'pay_{order_id}')]])
+
+def get_page_navigation(prefix: str, page: int, pages: int,
+                        prev_text: str = "◀️ Назад", next_text: str = "Далее ▶️"):
+    """Возвращает ряд кнопок навигации по страницам списка."""
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton(prev_text, callback_data=f'{prefix}_page_{page - 1}'))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton(next_text, callback_data=f'{prefix}_page_{page + 1}'))
+    return row
+
+def get_page(callback_data: str) -> int:
+    """Возвращает номер страницы из callback_data списка."""
+    match = PAGE_CALLBACK.search(callback_data)
+    return int(match.group(1)) if match else 0
+
+def shorten(text: str, limit: int = 200) -> str:
+    """Обрезает длинный текст, чтобы страница списка влезла в одно сообщение."""
+    if len(text) <= limit:
+        return text
+    return text[:limit - 1] + '…'
+
+def admin_only(handler):
+    """Пропускает к обработчику только администраторов."""
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.effective_user.id not in context.bot_data['admin_ids']:
+            if update.callback_query:
+                await update.callback_query.answer()
+            await update.effective_message.reply_text(DENY)
+            return ConversationHandler.END
+        return await handler(update, context)
+    return wrapper
+
+def debounce(key, ttl: float = DEBOUNCE_TTL) -> bool:
+    """Возвращает False, если то же действие уже выполнялось последние ttl секунд."""
+    now = time.monotonic()
+    if RECENT_CALLBACKS.get(key, 0) > now:
+        return False
+    if len(RECENT_CALLBACKS) > 1000:
+        for stale in [k for k, expires in RECENT_CALLBACKS.items() if expires <= now]:
+            del RECENT_CALLBACKS[stale]
+    RECENT_CALLBACKS[key] = now + ttl
+    return True
+
+def debounced(handler):
+    """Игнорирует повторные нажатия той же inline-кнопки."""
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        if not debounce((update.effective_user.id, query.data)):
+            await query.answer("⏳")
+            return ConversationHandler.END
+        return await handler(update, context)
+    return wrapper
+
+async def send_with_backoff(bot, chat_id: int, text: str, max_retries: int = 3, **kwargs):
+    """Отправляет сообщение, повторяя попытку после RetryAfter и TimedOut."""
+    for attempt in range(1, max_retries + 1):
+        try:
+            return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+        except RetryAfter as e:
+            if attempt == max_retries:
+                raise
+            delay = e.retry_after + 0.1
+        except TimedOut:
+            if attempt == max_retries:
+                raise
+            delay = 1
+        logger.warning(f"Retrying message to {chat_id} in {delay} s (attempt {attempt})")
+        await asyncio.sleep(delay)
+
+async def rate_gate(chat_id: int):
+    """Выдерживает паузу, чтобы в один чат уходило не больше сообщения в секунду."""
+    now = time.monotonic()
+    # Слот резервируется до ожидания, чтобы параллельные вызовы не ушли одновременно
+    slot = max(now, CHAT_LAST_SEND.get(chat_id, 0) + CHAT_SEND_INTERVAL)
+    # Слоты, после которых прошёл интервал, больше ни на что не влияют.
+    # Срок считается от самого слота, а не от записи: слот может быть в будущем
+    if len(CHAT_LAST_SEND) > 1000:
+        for stale in [k for k, last in CHAT_LAST_SEND.items() if last + CHAT_SEND_INTERVAL <= now]:
+            del CHAT_LAST_SEND[stale]
+    CHAT_LAST_SEND[chat_id] = slot
+    if slot > now:
+        await asyncio.sleep(slot - now)
+
+async def reply_admin_page(query, text: str, reply_markup):
+    """Отправляет страницу списка или обновляет текущую при переходе по страницам."""
+    # Страховка на случай неожиданно длинных полей: обрезанная страница лучше ошибки
+    text = shorten(text, ADMIN_MESSAGE_LIMIT)
+    if PAGE_CALLBACK.search(query.data):
+        await query.message.edit_text(text, reply_markup=reply_markup)
+    else:
+        await query.message.reply_text(text, reply_markup=reply_markup)
 
+@admin_only
 async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show admin panel."""
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await update.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
     await update.message.reply_text(
-        "👨‍💼 Панель администратора\n\n"
-        "Выберите действие:",
-        reply_markup=get_admin_keyboard()
+        ADMIN_PANEL_TEXT,
+        reply_markup=ADMIN_KEYBOARD
     )
     return ConversationHandler.END
 
+@admin_only
+@debounced
 async def admin_new_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show new orders."""
     query = update.callback_query
     await query.answer()
     
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await query.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
-    session = context.bot_data['db_session']
-    new_orders = session.query(Order).filter_by(status=OrderStatus.PENDING).all()
-    
-    logger.info(f"Found {len(new_orders)} new orders")
-    
-    if not new_orders:
-        await query.message.reply_text(
-            "📭 Новых заказов нет.",
-            reply_markup=get_admin_keyboard()
+    page = get_page(query.data)
+    async with context.bot_data['session_factory']() as session:
+        total = await session.scalar(
+            select(func.count(Order.id)).filter_by(status=OrderStatus.PENDING)
         )
-        return ConversationHandler.END
-    
-    for order in new_orders:
-        user = session.query(User).filter_by(id=order.user_id).first()
-        logger.info(f"Processing order #{order.id} for user {user.telegram_id if user else 'Unknown'}")
         
-        if not user:
-            logger.error(f"User not found for order #{order.id}")
+        logger.info(f"Found {total} new orders")
+        
+        if not total:
+            await reply_admin_page(query, NO_ORDERS, ADMIN_KEYBOARD)
+            return ConversationHandler.END
+        
+        pages = (total + ADMIN_PAGE_SIZE - 1) // ADMIN_PAGE_SIZE
+        page = min(page, pages - 1)
+        # Только нужные колонки: строки без создания ORM-объектов
+        new_orders = (await session.execute(
+            select(
+                Order.id, Order.work_type, Order.subject, Order.volume,
+                Order.deadline, Order.price, Order.contact_info, Order.comment,
+                User.first_name, User.telegram_id
+            )
+            .outerjoin(User, Order.user_id == User.id)
+            .where(Order.status == OrderStatus.PENDING)
+            .order_by(Order.id)
+            .offset(page * ADMIN_PAGE_SIZE)
+            .limit(ADMIN_PAGE_SIZE)
+        )).all()
+    
+    parts = []
+    keyboard = []
+    for row in new_orders:
+        if row.telegram_id is None:
+            logger.error(f"User not found for order #{row.id}")
             continue
             
-        message = (
-            f"🆕 Новый заказ #{order.id}\n"
-            f"👤 От: {user.first_name}\n"
-            f"📚 Тип: {order.work_type}\n"
-            f"📝 Предмет: {order.subject}\n"
-            f"📊 Объём: {order.volume}\n"
-            f"⏰ Дедлайн: {order.deadline.strftime('%d.%m.%Y')}\n"
-            f"💰 Цена: {order.price} ₽\n"
-            f"📞 Контакты: {order.contact_info}\n"
-            f"💬 Комментарий: {order.comment or 'Нет'}"
-        )
-        
-        await query.message.reply_text(
-            message,
-            reply_markup=get_order_keyboard(order.id)
+        parts.append(
+            f"🆕 Заказ #{row.id}\n"
+            f"👤 От: {row.first_name}\n"
+            f"📚 Тип: {row.work_type}\n"
+            f"📝 Предмет: {shorten(row.subject)}\n"
+            f"📊 Объём: {row.volume}\n"
+            f"⏰ Дедлайн: {row.deadline.strftime('%d.%m.%Y')}\n"
+            f"💰 Цена: {row.price} ₽\n"
+            f"📞 Контакты: {shorten(row.contact_info or 'Нет', 100)}\n"
+            f"💬 Комментарий: {shorten(row.comment or 'Нет')}"
         )
+        keyboard.append(get_order_buttons(row.id))
     
-    await query.message.reply_text(
-        "Выберите действие:",
-        reply_markup=get_admin_keyboard()
-    )
+    if pages > 1:
+        keyboard.append(get_page_navigation('admin_new_orders', page, pages))
+    
+    message = f"📥 Новые заказы (страница {page + 1}/{pages}):\n\n" + "\n\n".join(parts)
+    await reply_admin_page(query, message, InlineKeyboardMarkup(keyboard))
     return ConversationHandler.END
 
+@admin_only
+@debounced
 async def admin_accept_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Accept order and set price."""
     query = update.callback_query
     await query.answer()
     
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await query.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
-    order_id = int(query.data.split('_')[2])
-    session = context.bot_data['db_session']
+    order_id = int(ORDER_CALLBACK.match(query.data).group(1))
     
     try:
         logger.info(f"Accepting order #{order_id}")
         
-        order = session.query(Order).filter_by(id=order_id).first()
+        async with context.bot_data['session_factory']() as session:
+            order = await session.scalar(select(Order.id).where(Order.id == order_id))
         if not order:
             logger.error(f"Order #{order_id} not found")
-            await query.message.reply_text("❌ Заказ не найден.")
+            await query.message.reply_text(ORDER_NOT_FOUND)
             return ConversationHandler.END
         
         # Store order_id in context for price setting
@@ -140,25 +315,21 @@ async def admin_accept_order(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
     except Exception as e:
         logger.error(f"Error accepting order: {str(e)}", exc_info=True)
-        session.rollback()
         await query.message.reply_text(
             f"❌ Произошла ошибка при принятии заказа.\n"
             f"Ошибка: {str(e)}",
-            reply_markup=get_admin_keyboard()
+            reply_markup=ADMIN_KEYBOARD
         )
     
     return ConversationHandler.END
 
+@admin_only
 async def handle_price_setting(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle price setting by admin."""
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await update.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
     if 'current_order_id' not in context.user_data:
         await update.message.reply_text(
-            "❌ Ошибка: заказ не найден.",
-            reply_markup=get_admin_keyboard()
+            ORDER_NOT_FOUND_ERROR,
+            reply_markup=ADMIN_KEYBOARD
         )
         return ConversationHandler.END
     
@@ -166,490 +337,620 @@ async def handle_price_setting(update: Update, context: ContextTypes.DEFAULT_TYP
         price = float(update.message.text)
         if price <= 0:
             await update.message.reply_text(
-                "❌ Цена должна быть больше нуля. Попробуйте еще раз:"
+                PRICE_NOT_POSITIVE
             )
             return WAITING_PRICE
         
         order_id = context.user_data['current_order_id']
-        session = context.bot_data['db_session']
         
         logger.info(f"Setting price for order #{order_id}")
         
-        # Проверяем существование заказа
-        order = session.query(Order).filter_by(id=order_id).first()
-        if not order:
-            logger.error(f"Order #{order_id} not found")
-            await update.message.reply_text(
-                "❌ Заказ не найден.",
-                reply_markup=get_admin_keyboard()
-            )
-            return ConversationHandler.END
-        
-        # Проверяем существование пользователя
-        user = session.query(User).filter_by(id=order.user_id).first()
-        if not user:
-            logger.error(f"User not found for order #{order_id}")
-            await update.message.reply_text(
-                "❌ Пользователь не найден.",
-                reply_markup=get_admin_keyboard()
-            )
-            return ConversationHandler.END
-        
-        logger.info(f"Found user: {user.telegram_id} for order #{order_id}")
-        logger.info(f"User details - ID: {user.id}, Telegram ID: {user.telegram_id}, Name: {user.first_name}")
-        
-        # Отправляем уведомление пользователю
-        keyboard = [[InlineKeyboardButton("Оплатить", callback_data=f'pay_{order.id}')]]
-        try:
-            logger.info(f"Attempting to send notification to user {user.telegram_id}")
-            
-            # Проверяем, что telegram_id не None
-            if not user.telegram_id:
-                raise ValueError("User telegram_id is None")
-            
-            notification_text = (
-                f"✅ Ваш заказ #{order.id} принят!\n"
-                f"💰 Стоимость: {price} ₽\n"
-                "Для подтверждения заказа — перейдите к оплате:"
-            )
-            
-            logger.info(f"Sending message to user {user.telegram_id} with text: {notification_text}")
-            
-            # Отправляем сообщение пользователю
-            await context.bot.send_message(
-                chat_id=user.telegram_id,
-                text=notification_text,
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            logger.info(f"Notification sent successfully to user {user.telegram_id}")
+        async with context.bot_data['session_factory']() as session:
+            # Проверяем существование заказа; клиент загружается тем же запросом
+            order = await session.get(Order, order_id, options=[joinedload(Order.user)])
+            if not order:
+                logger.error(f"Order #{order_id} not found")
+                await update.message.reply_text(
+                    ORDER_NOT_FOUND,
+                    reply_markup=ADMIN_KEYBOARD
+                )
+                return ConversationHandler.END
             
-            # Только после успешной отправки сообщения обновляем цену в базе данных
-            order.price = price
-            session.commit()
-            logger.info(f"Updated order #{order_id} with price {price}")
+            # Проверяем существование пользователя
+            user = order.user
+            if not user:
+                logger.error(f"User not found for order #{order_id}")
+                await update.message.reply_text(
+                    USER_NOT_FOUND,
+                    reply_markup=ADMIN_KEYBOARD
+                )
+                return ConversationHandler.END
             
-            # Отправляем подтверждение админу
-            await update.message.reply_text(
-                f"✅ Цена установлена: {price} ₽\n"
-                f"Пользователь уведомлен о стоимости.",
-                reply_markup=get_admin_keyboard()
-            )
+            logger.info(f"Found user: {user.telegram_id} for order #{order_id}")
+            logger.info(f"User details - ID: {user.id}, Telegram ID: {user.telegram_id}, Name: {user.first_name}")
             
-            # Очищаем текущий заказ из контекста только после успешной отправки
-            del context.user_data['current_order_id']
-            logger.info(f"Cleared order #{order_id} from context")
+            # Отправляем уведомление пользователю
+            try:
+                logger.info(f"Attempting to send notification to user {user.telegram_id}")
+                
+                # Проверяем, что telegram_id не None
+                if not user.telegram_id:
+                    raise ValueError("User telegram_id is None")
+                
+                notification_text = (
+                    f"✅ Ваш заказ #{order.id} принят!\n"
+                    f"💰 Стоимость: {price} ₽\n"
+                    "Для подтверждения заказа — перейдите к оплате:"
+                )
+                
+                logger.info(f"Sending message to user {user.telegram_id} with text: {notification_text}")
+                
+                # Отправляем сообщение пользователю
+                await rate_gate(user.telegram_id)
+                await send_with_backoff(
+                    context.bot,
+                    user.telegram_id,
+                    notification_text,
+                    reply_markup=get_pay_keyboard(order.id)
+                )
+                logger.info(f"Notification sent successfully to user {user.telegram_id}")
+                
+                # Только после успешной отправки сообщения обновляем цену в базе данных
+                order.price = price
+                await session.commit()
+                invalidate_stats(context)
+                logger.info(f"Updated order #{order_id} with price {price}")
+                
+                # Отправляем подтверждение админу
+                await update.message.reply_text(
+                    f"✅ Цена установлена: {price} ₽\n"
+                    f"Пользователь уведомлен о стоимости.",
+                    reply_markup=ADMIN_KEYBOARD
+                )
+                
+                # Очищаем текущий заказ из контекста только после успешной отправки
+                del context.user_data['current_order_id']
+                logger.info(f"Cleared order #{order_id} from context")
             
-        except Exception as e:
-            logger.error(f"Error sending notification to user {user.telegram_id}: {str(e)}", exc_info=True)
-            error_message = (
-                f"❌ Не удалось отправить уведомление пользователю.\n"
-                f"Ошибка: {str(e)}\n"
-                f"telegram_id пользователя: {user.telegram_id}"
-            )
-            await update.message.reply_text(
-                error_message,
-                reply_markup=get_admin_keyboard()
-            )
-            return ConversationHandler.END
+            except Exception as e:
+                logger.error(f"Error sending notification to user {user.telegram_id}: {str(e)}", exc_info=True)
+                error_message = (
+                    f"❌ Не удалось отправить уведомление пользователю.\n"
+                    f"Ошибка: {str(e)}\n"
+                    f"telegram_id пользователя: {user.telegram_id}"
+                )
+                await update.message.reply_text(
+                    error_message,
+                    reply_markup=ADMIN_KEYBOARD
+                )
+                return ConversationHandler.END
         
     except ValueError:
         await update.message.reply_text(
-            "❌ Пожалуйста, введите корректную сумму:"
+            INVALID_PRICE
         )
         return WAITING_PRICE
     except Exception as e:
         logger.error(f"Error setting price: {str(e)}", exc_info=True)
-        session.rollback()
         await update.message.reply_text(
             f"❌ Произошла ошибка при установке цены.\n"
             f"Ошибка: {str(e)}",
-            reply_markup=get_admin_keyboard()
+            reply_markup=ADMIN_KEYBOARD
         )
     
     return ConversationHandler.END
 
+@admin_only
+@debounced
 async def admin_reject_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Reject order."""
     query = update.callback_query
     await query.answer()
     
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await query.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
-    order_id = int(query.data.split('_')[2])
-    session = context.bot_data['db_session']
+    order_id = int(ORDER_CALLBACK.match(query.data).group(1))
     
     try:
-        order = session.query(Order).filter_by(id=order_id).first()
-        if not order:
-            await query.message.reply_text("❌ Заказ не найден.")
-            return ConversationHandler.END
+        # Статус меняется одним UPDATE, который сразу возвращает telegram_id клиента
+        async with context.bot_data['session_factory']() as session:
+            telegram_id = await session.scalar(
+                sa_update(Order)
+                .where(Order.id == order_id)
+                .values(status=OrderStatus.CANCELLED)
+                .returning(
+                    select(User.telegram_id)
+                    .where(User.id == Order.user_id)
+                    .scalar_subquery()
+                )
+            )
+            await session.commit()
         
-        order.status = OrderStatus.CANCELLED
-        session.commit()
+        if telegram_id is None:
+            await query.message.reply_text(ORDER_NOT_FOUND)
+            return ConversationHandler.END
+        invalidate_stats(context)
         
         # Notify user
-        user = session.query(User).filter_by(id=order.user_id).first()
-        await context.bot.send_message(
-            chat_id=user.telegram_id,
-            text=f"❌ Ваш заказ #{order.id} отклонен."
+        await rate_gate(telegram_id)
+        await send_with_backoff(
+            context.bot,
+            telegram_id,
+            f"❌ Ваш заказ #{order_id} отклонен."
         )
         
         await query.message.reply_text(
             f"❌ Заказ #{order_id} отклонен.",
-            reply_markup=get_admin_keyboard()
+            reply_markup=ADMIN_KEYBOARD
         )
         
     except Exception as e:
         logger.error(f"Error rejecting order: {str(e)}", exc_info=True)
-        session.rollback()
         await query.message.reply_text(
-            "❌ Произошла ошибка при отклонении заказа.",
-            reply_markup=get_admin_keyboard()
+            REJECT_ERROR,
+            reply_markup=ADMIN_KEYBOARD
         )
     
     return ConversationHandler.END
 
+async def build_stats(session) -> str:
+    """Собирает текст статистики для админ-панели."""
+    # Get orders by status in one grouped query
+    order_counts = [0] * len(STATUS_LABELS)
+    result = await session.execute(
+        select(Order.status, func.count(Order.id)).group_by(Order.status)
+    )
+    for status, count in result:
+        order_counts[STATUS_INDEX[status]] = count
+    
+    # Get total orders
+    total_orders = sum(order_counts)
+    
+    # Get total users and revenue in a single query
+    total_users, total_revenue = (await session.execute(
+        select(
+            select(func.count(User.id)).scalar_subquery(),
+            select(func.coalesce(func.sum(Payment.amount), 0))
+            .where(Payment.status == PaymentStatus.COMPLETED)
+            .scalar_subquery()
+        )
+    )).one()
+    
+    lines = [
+        "📊 Статистика\n",
+        f"👥 Всего пользователей: {total_users}",
+        f"📦 Всего заказов: {total_orders}",
+        f"💰 Общая выручка: {total_revenue} ₽\n",
+        "📈 Заказы по статусам:"
+    ]
+    lines.extend(f"{label}: {count}" for label, count in zip(STATUS_LABELS, order_counts))
+    return "\n".join(lines)
+
+def invalidate_stats(context: ContextTypes.DEFAULT_TYPE):
+    """Сбрасывает кэш статистики после изменения заказов или платежей."""
+    context.bot_data.pop('stats_cache', None)
+
+@admin_only
+@debounced
 async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show statistics."""
     query = update.callback_query
     await query.answer()
     
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await query.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
-    session = context.bot_data['db_session']
-    
     try:
-        # Get total orders
-        total_orders = session.query(Order).count()
-        
-        # Get orders by status
-        orders_by_status = {}
-        for status in OrderStatus:
-            count = session.query(Order).filter_by(status=status).count()
-            orders_by_status[status] = count
-        
-        # Get total users
-        total_users = session.query(User).count()
-        
-        # Get total revenue
-        total_revenue = session.query(Payment).filter_by(status=PaymentStatus.COMPLETED).with_entities(func.sum(Payment.amount)).scalar() or 0
-        
-        message = (
-            "📊 Статистика\n\n"
-            f"👥 Всего пользователей: {total_users}\n"
-            f"📦 Всего заказов: {total_orders}\n"
-            f"💰 Общая выручка: {total_revenue} ₽\n\n"
-            "📈 Заказы по статусам:\n"
-        )
-        
-        for status, count in orders_by_status.items():
-            message += f"{ORDER_STATUS_MESSAGES[status]}: {count}\n"
+        # Статистика кэшируется, повторные нажатия не нагружают базу
+        cached = context.bot_data.get('stats_cache')
+        now = time.monotonic()
+        if cached and cached[0] > now:
+            message = cached[1]
+        else:
+            async with context.bot_data['session_factory']() as session:
+                message = await build_stats(session)
+            context.bot_data['stats_cache'] = (now + STATS_CACHE_TTL, message)
         
         await query.message.reply_text(
             message,
-            reply_markup=get_admin_keyboard()
+            reply_markup=ADMIN_KEYBOARD
         )
         
     except Exception as e:
         logger.error(f"Error getting stats: {str(e)}", exc_info=True)
         await query.message.reply_text(
-            "❌ Произошла ошибка при получении статистики.",
-            reply_markup=get_admin_keyboard()
+            STATS_ERROR,
+            reply_markup=ADMIN_KEYBOARD
         )
     
     return ConversationHandler.END
 
+@admin_only
+@debounced
 async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start broadcast process."""
     query = update.callback_query
     await query.answer()
     
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await query.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
     await query.message.reply_text(
-        "📢 Введите сообщение для рассылки:"
+        BROADCAST_PROMPT
     )
     return WAITING_BROADCAST
 
+@admin_only
 async def handle_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle broadcast message."""
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await update.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
     message = update.message.text
-    session = context.bot_data['db_session']
     
     try:
-        users = session.query(User).all()
-        sent_count = 0
-        failed_count = 0
-        
-        for user in users:
-            try:
-                await context.bot.send_message(
-                    chat_id=user.telegram_id,
-                    text=message
+        async with context.bot_data['session_factory']() as session:
+            # Сообщение о ходе рассылки отправляем до создания задачи: иначе
+            # process_broadcasts может завершить небольшую рассылку раньше,
+            # чем появится message_id, и итог до администратора не дойдёт
+            total = await session.scalar(select(func.count(User.id)))
+            progress = await update.message.reply_text(
+                f"📤 Рассылка поставлена в очередь\n"
+                f"👥 Получателей: {total}",
+                reply_markup=ADMIN_KEYBOARD
+            )
+            
+            # Ставим рассылку в очередь, отправляет её process_broadcasts
+            job = BroadcastJob(
+                text=message,
+                chat_id=update.effective_chat.id,
+                message_id=progress.message_id
+            )
+            session.add(job)
+            await session.flush()
+            await session.execute(
+                insert(BroadcastRecipient).from_select(
+                    ['job_id', 'user_id'],
+                    select(literal(job.id), User.id)
                 )
-                sent_count += 1
-            except Exception as e:
-                logger.error(f"Error sending broadcast to user {user.telegram_id}: {str(e)}")
-                failed_count += 1
-        
-        await update.message.reply_text(
-            f"✅ Рассылка завершена\n"
-            f"📤 Успешно отправлено: {sent_count}\n"
-            f"❌ Ошибок: {failed_count}",
-            reply_markup=get_admin_keyboard()
-        )
+            )
+            await session.commit()
         
     except Exception as e:
         logger.error(f"Error during broadcast: {str(e)}", exc_info=True)
         await update.message.reply_text(
-            "❌ Произошла ошибка при рассылке.",
-            reply_markup=get_admin_keyboard()
+            BROADCAST_ERROR,
+            reply_markup=ADMIN_KEYBOARD
         )
     
     return ConversationHandler.END
 
-async def admin_reviews(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show reviews."""
-    query = update.callback_query
-    await query.answer()
+async def report_broadcast_progress(bot, job: BroadcastJob, counts: dict):
+    """Обновляет у администратора сообщение о ходе рассылки."""
+    if not job.message_id:
+        return
     
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await query.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
-    session = context.bot_data['db_session']
+    header = "✅ Рассылка завершена" if job.is_completed else "📤 Рассылка выполняется"
+    try:
+        await bot.edit_message_text(
+            f"{header} (#{job.id})\n"
+            f"📤 Успешно отправлено: {counts.get(BroadcastStatus.SENT, 0)}\n"
+            f"❌ Ошибок: {counts.get(BroadcastStatus.FAILED, 0)}\n"
+            f"⏳ В очереди: {counts.get(BroadcastStatus.PENDING, 0)}",
+            chat_id=job.chat_id,
+            message_id=job.message_id,
+            reply_markup=ADMIN_KEYBOARD
+        )
+    except Exception as e:
+        logger.warning(f"Error reporting broadcast #{job.id} progress: {str(e)}")
+
+async def process_broadcasts(context: ContextTypes.DEFAULT_TYPE):
+    """Отправляет очередную пачку сообщений из очереди рассылок.
     
+    Запускается JobQueue раз в BROADCAST_BATCH_INTERVAL секунд. Статус
+    каждого получателя хранится в базе, поэтому после перезапуска бота
+    рассылка продолжается с того же места.
+    """
     try:
-        reviews = session.query(Review).order_by(Review.created_at.desc()).all()
-        
-        if not reviews:
-            await query.message.reply_text(
-                "📭 Отзывов пока нет.",
-                reply_markup=get_admin_keyboard()
+        async with context.bot_data['session_factory']() as session:
+            job = await session.scalar(
+                select(BroadcastJob)
+                .filter_by(is_completed=False)
+                .order_by(BroadcastJob.id)
+                .limit(1)
             )
-            return ConversationHandler.END
+            if not job:
+                return
+            
+            recipients = (await session.execute(
+                select(BroadcastRecipient.id, User.telegram_id)
+                .join(User, BroadcastRecipient.user_id == User.id)
+                .where(
+                    BroadcastRecipient.job_id == job.id,
+                    BroadcastRecipient.status == BroadcastStatus.PENDING
+                )
+                .order_by(BroadcastRecipient.id)
+                .limit(BROADCAST_BATCH_SIZE)
+            )).all()
+        
+        # Ошибки отдельных получателей копятся по типам до конца рассылки
+        errors = context.bot_data.setdefault('broadcast_errors', {}).setdefault(job.id, Counter())
         
-        for review in reviews:
-            user = session.query(User).filter_by(id=review.user_id).first()
-            message = (
-                f"⭐ Отзыв от {user.first_name} (@{user.username})\n"
-                f"📅 {review.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-                f"📝 {review.text}\n"
-                f"💬 Ответ: {review.admin_response or 'Нет ответа'}"
+        async def send(telegram_id):
+            try:
+                await send_with_backoff(context.bot, telegram_id, job.text)
+                return True
+            except Exception as e:
+                logger.debug("broadcast fail uid=%s err=%s", telegram_id, e.__class__.__name__)
+                errors[e.__class__.__name__] += 1
+                return False
+        
+        # Отправка идёт при закрытой сессии: соединение возвращается в пул,
+        # а транзакция чтения не удерживает снимок WAL от контрольной точки
+        results = await asyncio.gather(*(send(telegram_id) for _, telegram_id in recipients))
+        
+        async with context.bot_data['session_factory']() as session:
+            for status, ok in ((BroadcastStatus.SENT, True), (BroadcastStatus.FAILED, False)):
+                ids = [recipient_id for (recipient_id, _), result in zip(recipients, results) if result is ok]
+                if ids:
+                    await session.execute(
+                        sa_update(BroadcastRecipient)
+                        .where(BroadcastRecipient.id.in_(ids))
+                        .values(status=status, attempts=BroadcastRecipient.attempts + 1)
+                    )
+            
+            if len(recipients) < BROADCAST_BATCH_SIZE:
+                # Объект отсоединился при закрытии первой сессии, добавляем его без SELECT
+                session.add(job)
+                job.is_completed = True
+                job.completed_at = datetime.now()
+            await session.commit()
+            
+            counts = dict((await session.execute(
+                select(BroadcastRecipient.status, func.count(BroadcastRecipient.id))
+                .filter_by(job_id=job.id)
+                .group_by(BroadcastRecipient.status)
+            )).all())
+        
+        processed = counts.get(BroadcastStatus.SENT, 0) + counts.get(BroadcastStatus.FAILED, 0)
+        if job.is_completed:
+            errors = context.bot_data['broadcast_errors'].pop(job.id)
+            logger.info(
+                "broadcast done sent=%d failed=%d err_counts=%r",
+                counts.get(BroadcastStatus.SENT, 0),
+                counts.get(BroadcastStatus.FAILED, 0),
+                dict(errors)
             )
+            await report_broadcast_progress(context.bot, job, counts)
+        elif processed // BROADCAST_BATCH_SIZE % BROADCAST_PROGRESS_BATCHES == 0:
+            await report_broadcast_progress(context.bot, job, counts)
+        
+    except Exception as e:
+        logger.error(f"Error processing broadcast queue: {str(e)}", exc_info=True)
+
+@admin_only
+@debounced
+async def admin_reviews(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show reviews."""
+    query = update.callback_query
+    await query.answer()
+    
+    try:
+        page = get_page(query.data)
+        async with context.bot_data['session_factory']() as session:
+            total = await session.scalar(select(func.count(Review.id)))
+            
+            if not total:
+                await reply_admin_page(query, NO_REVIEWS, ADMIN_KEYBOARD)
+                return ConversationHandler.END
             
-            keyboard = [[InlineKeyboardButton("💬 Ответить", callback_data=f'admin_review_response_{review.id}')]]
-            await query.message.reply_text(
-                message,
-                reply_markup=InlineKeyboardMarkup(keyboard)
+            pages = (total + ADMIN_PAGE_SIZE - 1) // ADMIN_PAGE_SIZE
+            page = min(page, pages - 1)
+            reviews = (await session.execute(
+                select(
+                    Review.id, Review.text, Review.created_at, Review.admin_response,
+                    User.first_name, User.username
+                )
+                .join(User, Review.user_id == User.id)
+                .order_by(Review.created_at.desc())
+                .offset(page * ADMIN_PAGE_SIZE)
+                .limit(ADMIN_PAGE_SIZE)
+            )).all()
+        
+        parts = []
+        keyboard = []
+        for row in reviews:
+            parts.append(
+                f"⭐ Отзыв #{row.id} от {row.first_name} (@{row.username})\n"
+                f"📅 {row.created_at.strftime('%d.%m.%Y %H:%M')}\n"
+                f"📝 {shorten(row.text)}\n"
+                f"💬 Ответ: {shorten(row.admin_response or 'Нет ответа')}"
             )
+            keyboard.append([InlineKeyboardButton(f"💬 Ответить на отзыв #{row.id}", callback_data=f'admin_review_response_{row.id}')])
         
-        await query.message.reply_text(
-            "Выберите действие:",
-            reply_markup=get_admin_keyboard()
-        )
+        if pages > 1:
+            keyboard.append(get_page_navigation('admin_reviews', page, pages))
+        
+        message = f"⭐ Отзывы (страница {page + 1}/{pages}):\n\n" + "\n\n".join(parts)
+        await reply_admin_page(query, message, InlineKeyboardMarkup(keyboard))
         
     except Exception as e:
         logger.error(f"Error getting reviews: {str(e)}", exc_info=True)
         await query.message.reply_text(
-            "❌ Произошла ошибка при получении отзывов.",
-            reply_markup=get_admin_keyboard()
+            REVIEWS_ERROR,
+            reply_markup=ADMIN_KEYBOARD
         )
     
     return ConversationHandler.END
 
+@admin_only
+@debounced
 async def admin_review_response(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start review response process."""
     query = update.callback_query
     await query.answer()
     
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await query.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
-    review_id = int(query.data.split('_')[3])
+    review_id = int(RESPONSE_CALLBACK.match(query.data).group(1))
     context.user_data['review_id'] = review_id
     
     await query.message.reply_text(
-        "💬 Введите ответ на отзыв:"
+        REVIEW_RESPONSE_PROMPT
     )
     return WAITING_REVIEW_RESPONSE
 
+@admin_only
 async def handle_review_response(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle review response."""
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await update.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
     if 'review_id' not in context.user_data:
         await update.message.reply_text(
-            "❌ Ошибка: отзыв не найден.",
-            reply_markup=get_admin_keyboard()
+            REVIEW_NOT_FOUND_ERROR,
+            reply_markup=ADMIN_KEYBOARD
         )
         return ConversationHandler.END
     
     review_id = context.user_data['review_id']
     response = update.message.text
-    session = context.bot_data['db_session']
     
     try:
-        review = session.query(Review).filter_by(id=review_id).first()
-        if not review:
-            await update.message.reply_text(
-                "❌ Отзыв не найден.",
-                reply_markup=get_admin_keyboard()
-            )
-            return ConversationHandler.END
-        
-        review.admin_response = response
-        session.commit()
+        async with context.bot_data['session_factory']() as session:
+            review = await session.get(Review, review_id, options=[joinedload(Review.user)])
+            if not review:
+                await update.message.reply_text(
+                    REVIEW_NOT_FOUND,
+                    reply_markup=ADMIN_KEYBOARD
+                )
+                return ConversationHandler.END
+            
+            review.admin_response = response
+            await session.commit()
+            
+            user = review.user
         
         # Notify user
-        user = session.query(User).filter_by(id=review.user_id).first()
-        await context.bot.send_message(
-            chat_id=user.telegram_id,
-            text=f"💬 Администратор ответил на ваш отзыв:\n\n{response}"
+        await rate_gate(user.telegram_id)
+        await send_with_backoff(
+            context.bot,
+            user.telegram_id,
+            f"💬 Администратор ответил на ваш отзыв:\n\n{response}"
         )
         
         await update.message.reply_text(
-            "✅ Ответ на отзыв сохранен.",
-            reply_markup=get_admin_keyboard()
+            REVIEW_RESPONSE_SAVED,
+            reply_markup=ADMIN_KEYBOARD
         )
         
     except Exception as e:
         logger.error(f"Error saving review response: {str(e)}", exc_info=True)
-        session.rollback()
         await update.message.reply_text(
-            "❌ Произошла ошибка при сохранении ответа.",
-            reply_markup=get_admin_keyboard()
+            RESPONSE_SAVE_ERROR,
+            reply_markup=ADMIN_KEYBOARD
         )
     
     return ConversationHandler.END
 
+@admin_only
+@debounced
 async def admin_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show messages."""
     query = update.callback_query
     await query.answer()
     
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await query.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
-    session = context.bot_data['db_session']
-    
     try:
-        messages = session.query(Message).order_by(Message.created_at.desc()).all()
-        
-        if not messages:
-            await query.message.reply_text(
-                "📭 Сообщений пока нет.",
-                reply_markup=get_admin_keyboard()
-            )
-            return ConversationHandler.END
-        
+        page = get_page(query.data)
+        async with context.bot_data['session_factory']() as session:
+            total = await session.scalar(select(func.count(Message.id)))
+            
+            if not total:
+                await reply_admin_page(query, NO_MESSAGES, ADMIN_KEYBOARD)
+                return ConversationHandler.END
+            
+            pages = (total + ADMIN_PAGE_SIZE - 1) // ADMIN_PAGE_SIZE
+            page = min(page, pages - 1)
+            messages = (await session.scalars(
+                select(Message)
+                .options(joinedload(Message.user))
+                .order_by(Message.created_at.desc())
+                .offset(page * ADMIN_PAGE_SIZE)
+                .limit(ADMIN_PAGE_SIZE)
+            )).all()
+        
+        parts = []
+        keyboard = []
         for message in messages:
-            user = session.query(User).filter_by(id=message.user_id).first()
-            message_text = (
-                f"📨 Сообщение от {user.first_name} (@{user.username})\n"
+            user = message.user
+            parts.append(
+                f"📨 Сообщение #{message.id} от {user.first_name} (@{user.username})\n"
                 f"📅 {message.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-                f"📝 {message.text}\n"
-                f"💬 Ответ: {message.admin_response or 'Нет ответа'}"
-            )
-            
-            keyboard = [[InlineKeyboardButton("💬 Ответить", callback_data=f'admin_message_response_{message.id}')]]
-            await query.message.reply_text(
-                message_text,
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                f"📝 {shorten(message.text)}\n"
+                f"💬 Ответ: {shorten(message.admin_response or 'Нет ответа')}"
             )
+            keyboard.append([InlineKeyboardButton(f"💬 Ответить на сообщение #{message.id}", callback_data=f'admin_message_response_{message.id}')])
         
-        await query.message.reply_text(
-            "Выберите действие:",
-            reply_markup=get_admin_keyboard()
-        )
+        if pages > 1:
+            keyboard.append(get_page_navigation('admin_messages', page, pages))
+        
+        message_text = f"📨 Сообщения (страница {page + 1}/{pages}):\n\n" + "\n\n".join(parts)
+        await reply_admin_page(query, message_text, InlineKeyboardMarkup(keyboard))
         
     except Exception as e:
         logger.error(f"Error getting messages: {str(e)}", exc_info=True)
         await query.message.reply_text(
-            "❌ Произошла ошибка при получении сообщений.",
-            reply_markup=get_admin_keyboard()
+            MESSAGES_ERROR,
+            reply_markup=ADMIN_KEYBOARD
         )
     
     return ConversationHandler.END
 
+@admin_only
+@debounced
 async def admin_message_response(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start message response process."""
     query = update.callback_query
     await query.answer()
     
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await query.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
-    message_id = int(query.data.split('_')[3])
+    message_id = int(RESPONSE_CALLBACK.match(query.data).group(1))
     context.user_data['message_id'] = message_id
     
     await query.message.reply_text(
-        "💬 Введите ответ на сообщение:"
+        MESSAGE_RESPONSE_PROMPT
     )
     return WAITING_USER_MESSAGE
 
+@admin_only
 async def handle_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle user message response."""
-    if update.effective_user.id != context.bot_data['admin_id']:
-        await update.message.reply_text("⛔ У вас нет доступа к админ-панели.")
-        return ConversationHandler.END
-    
     if 'message_id' not in context.user_data:
         await update.message.reply_text(
-            "❌ Ошибка: сообщение не найдено.",
-            reply_markup=get_admin_keyboard()
+            MESSAGE_NOT_FOUND_ERROR,
+            reply_markup=ADMIN_KEYBOARD
         )
         return ConversationHandler.END
     
     message_id = context.user_data['message_id']
     response = update.message.text
-    session = context.bot_data['db_session']
     
     try:
-        message = session.query(Message).filter_by(id=message_id).first()
-        if not message:
-            await update.message.reply_text(
-                "❌ Сообщение не найдено.",
-                reply_markup=get_admin_keyboard()
-            )
-            return ConversationHandler.END
-        
-        message.admin_response = response
-        session.commit()
+        async with context.bot_data['session_factory']() as session:
+            message = await session.get(Message, message_id, options=[joinedload(Message.user)])
+            if not message:
+                await update.message.reply_text(
+                    MESSAGE_NOT_FOUND,
+                    reply_markup=ADMIN_KEYBOARD
+                )
+                return ConversationHandler.END
+            
+            message.admin_response = response
+            await session.commit()
+            
+            user = message.user
         
         # Notify user
-        user = session.query(User).filter_by(id=message.user_id).first()
-        await context.bot.send_message(
-            chat_id=user.telegram_id,
-            text=f"💬 Администратор ответил на ваше сообщение:\n\n{response}"
+        await rate_gate(user.telegram_id)
+        await send_with_backoff(
+            context.bot,
+            user.telegram_id,
+            f"💬 Администратор ответил на ваше сообщение:\n\n{response}"
         )
         
         await update.message.reply_text(
-            "✅ Ответ на сообщение сохранен.",
-            reply_markup=get_admin_keyboard()
+            MESSAGE_RESPONSE_SAVED,
+            reply_markup=ADMIN_KEYBOARD
         )
         
     except Exception as e:
         logger.error(f"Error saving message response: {str(e)}", exc_info=True)
-        session.rollback()
         await update.message.reply_text(
-            "❌ Произошла ошибка при сохранении ответа.",
-            reply_markup=get_admin_keyboard()
+            RESPONSE_SAVE_ERROR,
+            reply_markup=ADMIN_KEYBOARD
         )
     
     return ConversationHandler.END 
\ No newline at end of file
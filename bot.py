@@ -1,35 +1,51 @@
 import os
+import re
+import queue
+import time
+import hashlib
+import asyncio
 import logging
+from logging.handlers import QueueHandler, QueueListener
+from dataclasses import dataclass
+from functools import lru_cache, wraps
 from datetime import datetime, timedelta
+from pathlib import Path
+from urllib.parse import urlparse
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler,
     ContextTypes, filters, ConversationHandler
 )
+from telegram.request import HTTPXRequest
 from dotenv import load_dotenv
-from sqlalchemy import text
-from functools import lru_cache
+from sqlalchemy import insert, select, text, update as sa_update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from cachetools import TTLCache
 
 # Загрузка переменных окружения
 load_dotenv()
 
-# Логирование
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
-)
+# Логирование: запись в файл и консоль идёт в отдельном потоке через очередь,
+# чтобы дисковый ввод-вывод не блокировал цикл событий
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_handlers = [logging.FileHandler('bot.log'), logging.StreamHandler()]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+queue_handler = QueueHandler(log_queue)
+# Итоговый формат задают обработчики слушателя, в очередь попадает только текст
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+log_listener.start()
 logger = logging.getLogger(__name__)
 
 # Отладочная информация
-logger.info(f"ADMIN_ID from env: {os.getenv('ADMIN_ID')}")
-logger.info(f"TELEGRAM_TOKEN from env: {os.getenv('TELEGRAM_TOKEN')}")
+logger.info("ADMIN_ID from env: %s", os.getenv('ADMIN_ID'))
+logger.info("TELEGRAM_TOKEN from env: %s", os.getenv('TELEGRAM_TOKEN'))
 
 # Модули проекта
-from database import init_db, Order, OrderStatus, User, Message, Review, Payment, PaymentStatus
+from database import init_db, init_async_db, Order, OrderStatus, User, Message, Review, Payment, PaymentStatus
 from states import (
     WAITING_WORK_TYPE,
     WAITING_SUBJECT,
@@ -49,7 +65,8 @@ from admin import (
     admin_reject_order, admin_broadcast, handle_broadcast,
     admin_reviews, admin_review_response, handle_review_response,
     admin_messages, admin_message_response, handle_user_message,
-    handle_price_setting
+    handle_price_setting, process_broadcasts, invalidate_stats, BROADCAST_BATCH_INTERVAL,
+    get_page, get_page_navigation, send_with_backoff
 )
 
 # Константы
@@ -63,175 +80,434 @@ BASE_PRICES = {
     'tasks': 400
 }
 
-# Кэшируем базовые цены
-@lru_cache(maxsize=128)
-def get_base_price(work_type: str) -> float:
-    return BASE_PRICES.get(work_type, 0)
+# Каталоги для файлов заказов и подтверждений оплаты, создаются при запуске
+FILES_DIR = os.path.join(os.getcwd(), 'files')
+PAYMENTS_DIR = os.path.join(os.getcwd(), 'payment_proofs')
+
+# Допустимые расширения файлов с заданием
+ALLOWED_EXTENSIONS = frozenset({'pdf', 'docx', 'doc'})
+
+# Объём работы: целое или десятичное число через точку
+VOLUME_RE = re.compile(r'^\d+(?:\.\d+)?$')
+
+# Дата дедлайна в формате ДД.ММ.ГГГГ (день и месяц могут быть из одной цифры)
+DATE_RE = re.compile(r'^(\d{1,2})\.(\d{1,2})\.(\d{4})$')
+
+# callback_data кнопок оплаты: pay_<id>, admin_confirm_payment_<id>, admin_reject_payment_<id>
+PAYMENT_CALLBACK = re.compile(r'(?:pay|admin_(?:confirm|reject)_payment)_(\d+)$')
+
+# Шаблоны callback_data для CallbackQueryHandler, компилируются один раз.
+# Идентификаторы в конце обязательны: иначе '^admin_reject_' перехватывал бы
+# и нажатия admin_reject_payment_<id>
+CREATE_ORDER_PATTERN = re.compile(r'^create_order$')
+WORK_TYPE_PATTERN = re.compile(r'^work_type_[a-z]+$')
+PRICE_PATTERN = re.compile(r'^price$')
+ORDERS_PATTERN = re.compile(r'^orders(_page_\d+)?$')
+SUPPORT_PATTERN = re.compile(r'^support$')
+REVIEWS_PATTERN = re.compile(r'^reviews$')
+BACK_PATTERN = re.compile(r'^back$')
+ADMIN_ACCEPT_PATTERN = re.compile(r'^admin_accept_\d+$')
+ADMIN_STATS_PATTERN = re.compile(r'^admin_stats$')
+ADMIN_NEW_ORDERS_PATTERN = re.compile(r'^admin_new_orders(_page_\d+)?$')
+ADMIN_REJECT_PATTERN = re.compile(r'^admin_reject_\d+$')
+ADMIN_BROADCAST_PATTERN = re.compile(r'^admin_broadcast$')
+ADMIN_REVIEWS_PATTERN = re.compile(r'^admin_reviews(_page_\d+)?$')
+ADMIN_REVIEW_RESPONSE_PATTERN = re.compile(r'^admin_review_response_\d+$')
+ADMIN_MESSAGES_PATTERN = re.compile(r'^admin_messages(_page_\d+)?$')
+ADMIN_MESSAGE_RESPONSE_PATTERN = re.compile(r'^admin_message_response_\d+$')
+PAY_PATTERN = re.compile(r'^pay_\d+$')
+ADMIN_CONFIRM_PAYMENT_PATTERN = re.compile(r'^admin_confirm_payment_\d+$')
+ADMIN_REJECT_PAYMENT_PATTERN = re.compile(r'^admin_reject_payment_\d+$')
+
+# Шаблоны сообщений о новом заказе, подставляются через format_map
+ORDER_CREATED_TEMPLATE = (
+    "✅ Заказ #{id} успешно создан!\n\n"
+    "📚 Тип: {work_type}\n"
+    "📝 Предмет: {subject}\n"
+    "📊 Объём: {volume}\n"
+    "⏰ Дедлайн: {deadline:%d.%m.%Y}\n\n"
+    "Администратор рассмотрит ваш заказ и установит точную стоимость."
+).format_map
+NEW_ORDER_TEMPLATE = (
+    "🆕 Новый заказ #{id}\n"
+    "👤 От: {first_name}\n"
+    "📚 Тип: {work_type}\n"
+    "📝 Предмет: {subject}\n"
+    "📊 Объём: {volume}\n"
+    "⏰ Дедлайн: {deadline:%d.%m.%Y}\n"
+    "💰 Базовая цена: {price} ₽\n"
+    "📞 Контакты: {contact_info}\n"
+    "💬 Комментарий: {comment}"
+).format_map
+
+# Ответ пользователю при непредвиденной ошибке в обработчике
+ERROR_TEXT = "Произошла ошибка. Пожалуйста, попробуйте позже."
+
+# Общий лимит Bot API на отправку уведомлений, сообщений в секунду
+NOTIFY_RATE = 30
+
+# Сколько секунд при остановке ждать отправки оставшихся уведомлений
+NOTIFY_DRAIN_TIMEOUT = 10
+
+# Периодичность обслуживания SQLite, секунды
+DB_OPTIMIZE_INTERVAL = 3600
+WAL_CHECKPOINT_INTERVAL = 600
+
+# Количество заказов на одной странице в «Мои заказы»
+ORDERS_PAGE_SIZE = 20
+
+# Значки статусов в списке заказов пользователя
+STATUS_EMOJI = {
+    OrderStatus.PENDING: '⏳',
+    OrderStatus.PAID: '💰',
+    OrderStatus.IN_PROGRESS: '🔄',
+    OrderStatus.COMPLETED: '✅',
+    OrderStatus.CANCELLED: '❌'
+}
+
+# Подсказки для ввода объёма по типу работы
+VOLUME_MESSAGES = {
+    'coursework': "Укажите количество страниц (обычно 25-35):",
+    'essay': "Укажите количество страниц (обычно 10-15):",
+    'control': "Укажите количество задач:",
+    'translation': "Укажите количество знаков или страниц:",
+    'presentation': "Укажите количество слайдов:",
+    'diploma': "Укажите количество страниц (обычно 60-80):",
+    'tasks': "Укажите количество задач:"
+}
+
+# Кэш telegram_id -> (id пользователя в базе, username, first_name)
+USER_ID_CACHE = TTLCache(maxsize=10_000, ttl=3600)
+
+async def get_or_create_user_id(session, tg_user, create: bool = True):
+    """Возвращает id пользователя в базе по его telegram_id.
+    
+    Если пользователя нет, он создаётся (при create=True). Смена username
+    или имени сохраняется в базе и сбрасывает запись кэша.
+    """
+    cached = USER_ID_CACHE.get(tg_user.id)
+    if cached and cached[1:] == (tg_user.username, tg_user.first_name):
+        return cached[0]
+    
+    row = (await session.execute(
+        select(User.id, User.username, User.first_name).filter_by(telegram_id=tg_user.id)
+    )).first()
+    if row:
+        user_id = row.id
+        if (row.username, row.first_name) != (tg_user.username, tg_user.first_name):
+            await session.execute(
+                sa_update(User).filter_by(id=user_id).values(
+                    username=tg_user.username,
+                    first_name=tg_user.first_name
+                )
+            )
+            await session.commit()
+    elif create:
+        # Два одновременных первых обращения пользователя не должны падать на
+        # уникальности telegram_id: строку вставляет один запрос, второй её перечитывает
+        user_id = await session.scalar(
+            sqlite_insert(User)
+            .values(
+                telegram_id=tg_user.id,
+                username=tg_user.username,
+                first_name=tg_user.first_name
+            )
+            .on_conflict_do_nothing(index_elements=[User.telegram_id])
+            .returning(User.id)
+        )
+        if user_id is None:
+            user_id = await session.scalar(
+                select(User.id).filter_by(telegram_id=tg_user.id)
+            )
+        await session.commit()
+    else:
+        return None
+    
+    USER_ID_CACHE[tg_user.id] = (user_id, tg_user.username, tg_user.first_name)
+    return user_id
+
+async def notification_worker(bot, notify_queue: asyncio.Queue):
+    """Отправляет уведомления из очереди, не превышая NOTIFY_RATE в секунду.
+    
+    Лимит соблюдается корзиной токенов: она пополняется непрерывно и вмещает
+    не больше NOTIFY_RATE токенов, поэтому короткий всплеск уходит сразу.
+    """
+    tokens = NOTIFY_RATE
+    last = time.monotonic()
+    while True:
+        message = await notify_queue.get()
+        try:
+            now = time.monotonic()
+            tokens = min(NOTIFY_RATE, tokens + (now - last) * NOTIFY_RATE)
+            last = now
+            if tokens < 1:
+                wait = (1 - tokens) / NOTIFY_RATE
+                await asyncio.sleep(wait)
+                tokens = 1
+                last = now + wait
+            tokens -= 1
+            await send_with_backoff(bot, **message)
+        except Exception as e:
+            logger.error("Error sending notification to %s: %s", message.get('chat_id'), e)
+        finally:
+            notify_queue.task_done()
+
+async def start_notification_worker(application: Application):
+    """Создаёт очередь уведомлений и запускает её обработчик."""
+    notify_queue = asyncio.Queue()
+    application.bot_data['notify_queue'] = notify_queue
+    application.bot_data['notify_task'] = asyncio.create_task(
+        notification_worker(application.bot, notify_queue)
+    )
+
+async def stop_notification_worker(application: Application):
+    """Досылает уведомления из очереди и останавливает её обработчик.
+    
+    Вызывается в post_stop, пока бот ещё инициализирован и может отправлять сообщения.
+    """
+    notify_queue = application.bot_data['notify_queue']
+    try:
+        await asyncio.wait_for(notify_queue.join(), timeout=NOTIFY_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(
+            "Notification queue not drained in %s s, dropping %s notifications",
+            NOTIFY_DRAIN_TIMEOUT, notify_queue.qsize()
+        )
+    application.bot_data['notify_task'].cancel()
+
+async def optimize_database(context: ContextTypes.DEFAULT_TYPE):
+    """Обновляет статистику планировщика запросов SQLite."""
+    try:
+        async with context.bot_data['session_factory']() as session:
+            await session.execute(text("PRAGMA optimize"))
+    except Exception as e:
+        logger.error("Error running PRAGMA optimize: %s", e)
+
+async def checkpoint_database(context: ContextTypes.DEFAULT_TYPE):
+    """Переносит WAL в основной файл базы и обрезает журнал."""
+    try:
+        async with context.bot_data['session_factory']() as session:
+            await session.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+    except Exception as e:
+        logger.error("Error running WAL checkpoint: %s", e)
+
+async def remove_file(file_path: str):
+    """Удаляет файл в отдельном потоке, чтобы не блокировать цикл событий."""
+    try:
+        await asyncio.to_thread(os.remove, file_path)
+    except FileNotFoundError:
+        pass
+
+async def save_telegram_file(file_info, file_path: str):
+    """Скачивает файл в память и записывает его на диск в отдельном потоке."""
+    data = await file_info.download_as_bytearray()
+    await asyncio.to_thread(Path(file_path).write_bytes, data)
 
+async def store_payment_proof(context: ContextTypes.DEFAULT_TYPE, order_id: int, file_id: str, file_path: str):
+    """Сохраняет подтверждение оплаты на диск и записывает путь в платёж."""
+    try:
+        file_info = await context.bot.get_file(file_id)
+        await save_telegram_file(file_info, file_path)
+        async with context.bot_data['session_factory']() as session:
+            await session.execute(
+                sa_update(Payment)
+                .where(Payment.order_id == order_id)
+                .values(proof_file=file_path)
+            )
+            await session.commit()
+    except Exception as e:
+        logger.error("Error saving payment proof for order #%s: %s", order_id, e, exc_info=True)
+        await remove_file(file_path)
+
+async def get_owned_order(session, order_id: int, tg_user):
+    """Возвращает заказ, если он принадлежит пользователю, иначе None.
+    
+    id пользователя берётся из кэша, поэтому обычно нужен один запрос по ключу.
+    """
+    user_id = await get_or_create_user_id(session, tg_user, create=False)
+    if user_id is None:
+        return None
+    return await session.scalar(
+        select(Order).where(Order.id == order_id, Order.user_id == user_id)
+    )
+
+@dataclass(slots=True)
 class OrderState:
-    def __init__(self):
-        self.work_type = None
-        self.subject = None
-        self.volume = None
-        self.deadline = None
-        self.file_path = None
-        self.comment = None
-        self.contact_info = None
+    """Данные заказа, собираемые в ходе диалога."""
+    work_type: str | None = None
+    subject: str | None = None
+    volume: str | None = None
+    deadline: datetime | None = None
+    file_path: str | None = None
+    comment: str | None = None
+    contact_info: str | None = None
 
     def is_valid(self) -> bool:
         """Проверяет валидность состояния заказа."""
-        return all([
-            self.work_type,
-            self.subject,
-            self.volume,
-            self.deadline,
-            self.contact_info
-        ])
+        return bool(
+            self.work_type
+            and self.subject
+            and self.volume
+            and self.deadline
+            and self.contact_info
+        )
+
+# Клавиатуры не меняются, поэтому создаются один раз при загрузке модуля
+MAIN_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📝 Создать заказ", callback_data='create_order')],
+    [InlineKeyboardButton("💰 Цены", callback_data='price')],
+    [InlineKeyboardButton("📦 Мои заказы", callback_data='orders')],
+    [InlineKeyboardButton("💬 Поддержка", callback_data='support')],
+    [InlineKeyboardButton("⭐ Отзывы", callback_data='reviews')]
+])
+CANCEL_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data='cancel')]])
+BACK_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton('◀️ Назад', callback_data='back')]])
+WORK_TYPE_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("📚 Курсовая", callback_data='work_type_coursework'),
+        InlineKeyboardButton("📝 Реферат", callback_data='work_type_essay')
+    ],
+    [
+        InlineKeyboardButton("📐 Контрольная", callback_data='work_type_control'),
+        InlineKeyboardButton("💡 Перевод", callback_data='work_type_translation')
+    ],
+    [
+        InlineKeyboardButton("🎓 Презентация", callback_data='work_type_presentation'),
+        InlineKeyboardButton("👨‍🏫 Диплом", callback_data='work_type_diploma')
+    ],
+    [InlineKeyboardButton("📋 Задачи", callback_data='work_type_tasks')],
+    [InlineKeyboardButton("❌ Отмена", callback_data='cancel')]
+])
 
 def get_main_keyboard():
     """Возвращает основную клавиатуру."""
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("📝 Создать заказ", callback_data='create_order')],
-        [InlineKeyboardButton("💰 Цены", callback_data='price')],
-        [InlineKeyboardButton("📦 Мои заказы", callback_data='orders')],
-        [InlineKeyboardButton("💬 Поддержка", callback_data='support')],
-        [InlineKeyboardButton("⭐ Отзывы", callback_data='reviews')]
-    ])
+    return MAIN_KEYBOARD
 
 def get_cancel_keyboard():
     """Возвращает клавиатуру с кнопкой отмены."""
-    return InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data='cancel')]])
+    return CANCEL_KEYBOARD
+
+def safe_handler(error_text: str = ERROR_TEXT, reply_markup=None, result=None):
+    """Перехватывает ошибки обработчика: пишет их в лог и отвечает пользователю.
+    
+    После ошибки пользователь получает error_text, а обработчик возвращает result.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            try:
+                return await handler(update, context)
+            except Exception:
+                logger.error("Error in %s", handler.__name__, exc_info=True)
+                await update.effective_message.reply_text(error_text, reply_markup=reply_markup)
+                return result
+        return wrapper
+    return decorator
 
+@lru_cache(maxsize=4096)
+def get_new_order_keyboard(order_id: int):
+    """Возвращает клавиатуру администратора для нового заказа."""
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("✅ Принять", callback_data=f'admin_accept_{order_id}'),
+            InlineKeyboardButton("❌ Отклонить", callback_data=f'admin_reject_{order_id}')
+        ],
+        [InlineKeyboardButton("💬 Написать", callback_data=f'admin_message_{order_id}')]
+    ])
+
+@lru_cache(maxsize=4096)
+def get_payment_review_keyboard(order_id: int):
+    """Возвращает клавиатуру администратора для проверки оплаты."""
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("✅ Подтвердить оплату", callback_data=f'admin_confirm_payment_{order_id}'),
+        InlineKeyboardButton("❌ Отклонить", callback_data=f'admin_reject_payment_{order_id}')
+    ]])
+
+@lru_cache(maxsize=4096)
+def get_user_reply_keyboard(user_id: int):
+    """Возвращает клавиатуру администратора для ответа пользователю."""
+    return InlineKeyboardMarkup([[InlineKeyboardButton("💬 Ответить", callback_data=f'message_user_{user_id}')]])
+
+@safe_handler(result=ConversationHandler.END)
 async def choose_work_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle work type selection."""
-    try:
-        # Обработка callback_query
-        if update.callback_query:
-            await update.callback_query.answer()
-            message = update.callback_query.message
-        else:
-            message = update.message
+    # Обработка callback_query
+    if update.callback_query:
+        await update.callback_query.answer()
+        message = update.callback_query.message
+    else:
+        message = update.message
 
-        keyboard = [
-            [
-                InlineKeyboardButton("📚 Курсовая", callback_data='work_type_coursework'),
-                InlineKeyboardButton("📝 Реферат", callback_data='work_type_essay')
-            ],
-            [
-                InlineKeyboardButton("📐 Контрольная", callback_data='work_type_control'),
-                InlineKeyboardButton("💡 Перевод", callback_data='work_type_translation')
-            ],
-            [
-                InlineKeyboardButton("🎓 Презентация", callback_data='work_type_presentation'),
-                InlineKeyboardButton("👨‍🏫 Диплом", callback_data='work_type_diploma')
-            ],
-            [InlineKeyboardButton("📋 Задачи", callback_data='work_type_tasks')],
-            [InlineKeyboardButton("❌ Отмена", callback_data='cancel')]
-        ]
-        
-        if update.callback_query:
-            await message.edit_text(
-                "Выберите тип работы:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-        else:
-            await message.reply_text(
-                "Выберите тип работы:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-        return WAITING_WORK_TYPE
-        
-    except Exception as e:
-        logger.error(f"Error in choose_work_type: {str(e)}", exc_info=True)
-        error_message = "Произошла ошибка. Пожалуйста, попробуйте позже."
-        if update.callback_query:
-            await update.callback_query.message.reply_text(error_message)
-        else:
-            await update.message.reply_text(error_message)
-        return ConversationHandler.END
+    if update.callback_query:
+        await message.edit_text(
+            "Выберите тип работы:",
+            reply_markup=WORK_TYPE_KEYBOARD
+        )
+    else:
+        await message.reply_text(
+            "Выберите тип работы:",
+            reply_markup=WORK_TYPE_KEYBOARD
+        )
+    return WAITING_WORK_TYPE
 
+@safe_handler("❌ Произошла ошибка при выборе типа работы. Пожалуйста, попробуйте позже.", reply_markup=CANCEL_KEYBOARD, result=ConversationHandler.END)
 async def handle_work_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle work type selection."""
-    try:
-        query = update.callback_query
-        await query.answer()
-        
-        work_type = query.data.replace('work_type_', '')
-        context.user_data['order_state'] = OrderState()
-        context.user_data['order_state'].work_type = work_type
-        
-        message = (
-            f"📚 {work_type.capitalize()}\n\n"
-            "Пожалуйста, укажите:\n"
-            "1. Предмет/дисциплину\n"
-            "2. Тему работы\n"
-            "3. Краткое описание задания\n\n"
-            "Например:\n"
-            "Предмет: Экономика\n"
-            "Тема: Анализ эффективности инвестиционных проектов\n"
-            "Описание: Необходимо провести анализ трех инвестиционных проектов..."
-        )
-        
-        await query.message.edit_text(
-            message,
-            reply_markup=get_cancel_keyboard()
-        )
-        
-        return WAITING_SUBJECT
-        
-    except Exception as e:
-        logger.error(f"Error in handle_work_type: {str(e)}", exc_info=True)
-        await update.callback_query.message.reply_text(
-            "❌ Произошла ошибка при выборе типа работы. Пожалуйста, попробуйте позже.",
-            reply_markup=get_cancel_keyboard()
-        )
-        return ConversationHandler.END
+    query = update.callback_query
+    await query.answer()
+    
+    work_type = query.data.replace('work_type_', '')
+    context.user_data['order_state'] = OrderState()
+    context.user_data['order_state'].work_type = work_type
+    
+    message = (
+        f"📚 {work_type.capitalize()}\n\n"
+        "Пожалуйста, укажите:\n"
+        "1. Предмет/дисциплину\n"
+        "2. Тему работы\n"
+        "3. Краткое описание задания\n\n"
+        "Например:\n"
+        "Предмет: Экономика\n"
+        "Тема: Анализ эффективности инвестиционных проектов\n"
+        "Описание: Необходимо провести анализ трех инвестиционных проектов..."
+    )
+    
+    await query.message.edit_text(
+        message,
+        reply_markup=get_cancel_keyboard()
+    )
+    
+    return WAITING_SUBJECT
 
+@safe_handler("❌ Произошла ошибка. Пожалуйста, попробуйте позже.", reply_markup=CANCEL_KEYBOARD, result=ConversationHandler.END)
 async def handle_subject(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle subject input."""
-    try:
-        if 'order_state' not in context.user_data:
-            await update.message.reply_text(
-                "❌ Произошла ошибка. Пожалуйста, начните заказ заново.",
-                reply_markup=get_cancel_keyboard()
-            )
-            return ConversationHandler.END
-        
-        subject = update.message.text.strip()
-        if len(subject) < 3:
-            await update.message.reply_text(
-                "❌ Слишком короткое описание. Пожалуйста, укажите более подробно:",
-                reply_markup=get_cancel_keyboard()
-            )
-            return WAITING_SUBJECT
-        
-        context.user_data['order_state'].subject = subject
-        
-        work_type = context.user_data['order_state'].work_type
-        volume_message = {
-            'coursework': "Укажите количество страниц (обычно 25-35):",
-            'essay': "Укажите количество страниц (обычно 10-15):",
-            'control': "Укажите количество задач:",
-            'translation': "Укажите количество знаков или страниц:",
-            'presentation': "Укажите количество слайдов:",
-            'diploma': "Укажите количество страниц (обычно 60-80):",
-            'tasks': "Укажите количество задач:"
-        }.get(work_type, "Укажите объём работы:")
-        
+    if 'order_state' not in context.user_data:
         await update.message.reply_text(
-            volume_message,
+            "❌ Произошла ошибка. Пожалуйста, начните заказ заново.",
             reply_markup=get_cancel_keyboard()
         )
-        
-        return WAITING_VOLUME
-        
-    except Exception as e:
-        logger.error(f"Error in handle_subject: {str(e)}", exc_info=True)
+        return ConversationHandler.END
+    
+    subject = update.message.text.strip()
+    if len(subject) < 3:
         await update.message.reply_text(
-            "❌ Произошла ошибка. Пожалуйста, попробуйте позже.",
+            "❌ Слишком короткое описание. Пожалуйста, укажите более подробно:",
             reply_markup=get_cancel_keyboard()
         )
-        return ConversationHandler.END
+        return WAITING_SUBJECT
+    
+    context.user_data['order_state'].subject = subject
+    
+    work_type = context.user_data['order_state'].work_type
+    volume_message = VOLUME_MESSAGES.get(work_type, "Укажите объём работы:")
+    
+    await update.message.reply_text(
+        volume_message,
+        reply_markup=get_cancel_keyboard()
+    )
+    
+    return WAITING_VOLUME
 
 async def handle_volume(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle volume input."""
@@ -239,7 +515,7 @@ async def handle_volume(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data['order_state'] = OrderState()
     
     volume = update.message.text.strip()
-    if not volume.replace('.', '').isdigit():
+    if not VOLUME_RE.match(volume):
         await update.message.reply_text(
             "❌ Пожалуйста, укажите числовое значение:",
             reply_markup=get_cancel_keyboard()
@@ -259,16 +535,21 @@ async def handle_deadline(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data['order_state'] = OrderState()
     
     try:
-        deadline = datetime.strptime(update.message.text.strip(), "%d.%m.%Y")
-        
-        if deadline < datetime.now():
+        match = DATE_RE.match(update.message.text.strip())
+        if not match:
+            raise ValueError("Invalid date format")
+        # datetime() сам выбрасывает ValueError для несуществующих дат
+        deadline = datetime(int(match[3]), int(match[2]), int(match[1]))
+        
+        now = datetime.now()
+        if deadline < now:
             await update.message.reply_text(
                 "❌ Дата не может быть в прошлом. Пожалуйста, укажите будущую дату:",
                 reply_markup=get_cancel_keyboard()
             )
             return WAITING_DEADLINE
         
-        max_deadline = datetime.now() + timedelta(days=365)
+        max_deadline = now + timedelta(days=365)
         if deadline > max_deadline:
             await update.message.reply_text(
                 "❌ Слишком далекий дедлайн. Пожалуйста, укажите дату в пределах года:",
@@ -291,6 +572,7 @@ async def handle_deadline(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return WAITING_DEADLINE
 
+@safe_handler("❌ Произошла ошибка при сохранении файла. Пожалуйста, попробуйте еще раз:", reply_markup=CANCEL_KEYBOARD, result=WAITING_FILE)
 async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle file upload."""
     logger.info("handle_file called")
@@ -299,90 +581,82 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.info("Creating new order state")
         context.user_data['order_state'] = OrderState()
     
-    try:
-        # Проверяем наличие файла или фото
-        if update.message.document:
-            logger.info(f"Received document: {update.message.document.file_name}")
-            file = update.message.document
-            file_ext = file.file_name.split('.')[-1].lower()
-            if file_ext not in ['pdf', 'docx', 'doc']:
-                await update.message.reply_text(
-                    "❌ Поддерживаются только файлы PDF и DOCX. Пожалуйста, отправьте файл в правильном формате.",
-                    reply_markup=get_cancel_keyboard()
-                )
-                return WAITING_FILE
-        elif update.message.photo:
-            logger.info("Received photo")
-            file = update.message.photo[-1]  # Берем фото с максимальным разрешением
-        else:
-            logger.info("No file or photo received")
+    # Проверяем наличие файла или фото
+    if update.message.document:
+        logger.info("Received document: %s", update.message.document.file_name)
+        file = update.message.document
+        file_ext = os.path.splitext(file.file_name)[1].lower().lstrip('.')
+        if file_ext not in ALLOWED_EXTENSIONS:
             await update.message.reply_text(
-                "❌ Пожалуйста, отправьте файл (PDF, DOCX) или фото.",
+                "❌ Поддерживаются только файлы PDF и DOCX. Пожалуйста, отправьте файл в правильном формате.",
                 reply_markup=get_cancel_keyboard()
             )
             return WAITING_FILE
+    elif update.message.photo:
+        logger.info("Received photo")
+        file = update.message.photo[-1]  # Берем фото с максимальным разрешением
+    else:
+        logger.info("No file or photo received")
+        await update.message.reply_text(
+            "❌ Пожалуйста, отправьте файл (PDF, DOCX) или фото.",
+            reply_markup=get_cancel_keyboard()
+        )
+        return WAITING_FILE
 
-        # Создаем директорию для файлов, если её нет
-        files_dir = os.path.join(os.getcwd(), 'files')
-        if not os.path.exists(files_dir):
-            logger.info(f"Creating directory: {files_dir}")
-            try:
-                os.makedirs(files_dir)
-            except Exception as e:
-                logger.error(f"Error creating directory: {str(e)}")
-                raise
-
-        # Генерируем уникальное имя файла
-        file_id = file.file_id
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        if update.message.document:
-            file_name = f"{timestamp}_{file_id}_{file.file_name}"
-        else:
-            file_name = f"{timestamp}_{file_id}.jpg"
-        
-        file_path = os.path.join(files_dir, file_name)
-        logger.info(f"Attempting to save file to: {file_path}")
+    # Имя файла — короткий хэш file_unique_id, одинаковый для повторных загрузок
+    file_id = file.file_id
+    short_name = hashlib.blake2b(file.file_unique_id.encode(), digest_size=8).hexdigest()
+    if update.message.document:
+        file_name = f"{short_name}.{file_ext}"
+    else:
+        file_name = f"{short_name}.jpg"
+    
+    file_path = os.path.join(FILES_DIR, file_name)
+    
+    # Этот файл уже загружали — повторно не скачиваем
+    if await asyncio.to_thread(os.path.exists, file_path):
+        logger.info("File already saved: %s", file_path)
+        context.user_data['order_state'].file_path = file_path
+        await update.message.reply_text(
+            "✅ Файл успешно загружен!\n\n"
+            "Добавьте комментарий к заказу (или отправьте '-' если комментария нет):",
+            reply_markup=get_cancel_keyboard()
+        )
+        return WAITING_COMMENT
+    
+    logger.info("Attempting to save file to: %s", file_path)
 
+    # Скачиваем файл
+    try:
+        # Получаем информацию о файле
+        file_info = await context.bot.get_file(file_id)
         # Скачиваем файл
-        try:
-            # Получаем информацию о файле
-            file_info = await context.bot.get_file(file_id)
-            # Скачиваем файл
-            await file_info.download_to_drive(file_path)
-            
-            # Проверяем, что файл действительно создался
-            if not os.path.exists(file_path):
-                raise Exception("File was not created after download")
-                
-            logger.info(f"File successfully saved to: {file_path}")
-            
-            # Сохраняем путь к файлу
-            context.user_data['order_state'].file_path = file_path
-            
-            await update.message.reply_text(
-                "✅ Файл успешно загружен!\n\n"
-                "Добавьте комментарий к заказу (или отправьте '-' если комментария нет):",
-                reply_markup=get_cancel_keyboard()
-            )
-            return WAITING_COMMENT
+        await save_telegram_file(file_info, file_path)
+        
+        # Проверяем, что файл действительно создался
+        if not await asyncio.to_thread(os.path.exists, file_path):
+            raise Exception("File was not created after download")
             
-        except Exception as e:
-            logger.error(f"Error downloading file: {str(e)}")
-            # Пытаемся удалить файл, если он был частично создан
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
-            raise
+        logger.info("File successfully saved to: %s", file_path)
+        
+        # Сохраняем путь к файлу
+        context.user_data['order_state'].file_path = file_path
         
-    except Exception as e:
-        logger.error(f"Error handling file: {str(e)}", exc_info=True)
         await update.message.reply_text(
-            "❌ Произошла ошибка при сохранении файла. Пожалуйста, попробуйте еще раз:",
+            "✅ Файл успешно загружен!\n\n"
+            "Добавьте комментарий к заказу (или отправьте '-' если комментария нет):",
             reply_markup=get_cancel_keyboard()
         )
-        return WAITING_FILE
+        return WAITING_COMMENT
+        
+    except Exception as e:
+        logger.error("Error downloading file: %s", e)
+        # Пытаемся удалить файл, если он был частично создан
+        try:
+            await remove_file(file_path)
+        except OSError:
+            pass
+        raise
 
 async def handle_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle comment input."""
@@ -401,6 +675,7 @@ async def handle_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return WAITING_CONTACT
 
+@safe_handler("❌ Произошла ошибка при создании заказа. Пожалуйста, попробуйте позже.", result=ConversationHandler.END)
 async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle contact info and finalize order."""
     if 'order_state' not in context.user_data:
@@ -420,78 +695,48 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return ConversationHandler.END
     
-    session = context.bot_data['db_session']
+    async with context.bot_data['session_factory']() as session:
+        user_id = await get_or_create_user_id(session, update.effective_user)
+        
+        # Заказ вставляется напрямую через Core, без отслеживания ORM-объекта
+        values = {
+            'user_id': user_id,
+            'work_type': order_state.work_type,
+            'subject': order_state.subject,
+            'volume': order_state.volume,
+            'deadline': order_state.deadline,
+            'status': OrderStatus.PENDING,
+            'price': BASE_PRICES.get(order_state.work_type, 0),
+            'file_path': order_state.file_path,
+            'comment': order_state.comment,
+            'contact_info': order_state.contact_info
+        }
+        order_id = await session.scalar(insert(Order).returning(Order.id), values)
+        await session.commit()
     
-    try:
-        user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
-        if not user:
-            user = User(
-                telegram_id=update.effective_user.id,
-                username=update.effective_user.username,
-                first_name=update.effective_user.first_name
-            )
-            session.add(user)
-            session.commit()
-        
-        order = Order(
-            user_id=user.id,
-            work_type=order_state.work_type,
-            subject=order_state.subject,
-            volume=order_state.volume,
-            deadline=order_state.deadline,
-            status=OrderStatus.PENDING,
-            price=get_base_price(order_state.work_type),
-            file_path=order_state.file_path,
-            comment=order_state.comment,
-            contact_info=order_state.contact_info
-        )
-        
-        session.add(order)
-        session.commit()
-        
-        await update.message.reply_text(
-            f"✅ Заказ #{order.id} успешно создан!\n\n"
-            f"📚 Тип: {order.work_type}\n"
-            f"📝 Предмет: {order.subject}\n"
-            f"📊 Объём: {order.volume}\n"
-            f"⏰ Дедлайн: {order.deadline.strftime('%d.%m.%Y')}\n\n"
-            "Администратор рассмотрит ваш заказ и установит точную стоимость."
-        )
-        
-        admin_message = (
-            f"🆕 Новый заказ #{order.id}\n"
-            f"👤 От: {user.first_name}\n"
-            f"📚 Тип: {order.work_type}\n"
-            f"📝 Предмет: {order.subject}\n"
-            f"📊 Объём: {order.volume}\n"
-            f"⏰ Дедлайн: {order.deadline.strftime('%d.%m.%Y')}\n"
-            f"💰 Базовая цена: {order.price} ₽\n"
-            f"📞 Контакты: {order.contact_info}\n"
-            f"💬 Комментарий: {order.comment or 'Нет'}"
-        )
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("✅ Принять", callback_data=f'admin_accept_{order.id}'),
-                InlineKeyboardButton("❌ Отклонить", callback_data=f'admin_reject_{order.id}')
-            ],
-            [InlineKeyboardButton("💬 Написать", callback_data=f'admin_message_{order.id}')]
-        ]
-        
-        await context.bot.send_message(
+    values['id'] = order_id
+    admin_message = NEW_ORDER_TEMPLATE({
+        **values,
+        'first_name': update.effective_user.first_name,
+        'comment': order_state.comment or 'Нет'
+    })
+    
+    # Подтверждение клиенту и уведомление администратору отправляются параллельно;
+    # ошибка одного из них не мешает второму
+    results = await asyncio.gather(
+        update.message.reply_text(ORDER_CREATED_TEMPLATE(values)),
+        context.bot.send_message(
             chat_id=context.bot_data['admin_id'],
             text=admin_message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-        
-        del context.user_data['order_state']
-        
-    except Exception as e:
-        logger.error(f"Error creating order: {str(e)}", exc_info=True)
-        session.rollback()
-        await update.message.reply_text(
-            "❌ Произошла ошибка при создании заказа. Пожалуйста, попробуйте позже."
-        )
+            reply_markup=get_new_order_keyboard(order_id)
+        ),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error("Error sending notification for order #%s: %s", order_id, result)
+    
+    del context.user_data['order_state']
     
     return ConversationHandler.END
 
@@ -501,384 +746,275 @@ async def cancel_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     if 'order_state' in context.user_data:
-        if context.user_data['order_state'].file_path and os.path.exists(context.user_data['order_state'].file_path):
+        file_path = context.user_data['order_state'].file_path
+        if file_path:
             try:
-                os.remove(context.user_data['order_state'].file_path)
+                # Одинаковые файлы хранятся под одним именем: не удаляем файл,
+                # если он уже прикреплён к сохранённому заказу
+                async with context.bot_data['session_factory']() as session:
+                    in_use = await session.scalar(
+                        select(Order.id).where(Order.file_path == file_path).limit(1)
+                    )
+                if not in_use:
+                    await remove_file(file_path)
             except Exception as e:
-                logger.error(f"Error deleting file: {str(e)}", exc_info=True)
+                logger.error("Error deleting file: %s", e, exc_info=True)
         
         del context.user_data['order_state']
     
     await query.message.reply_text(
         "❌ Создание заказа отменено.",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("◀️ Назад", callback_data='back')
-        ]])
+        reply_markup=BACK_KEYBOARD
     )
     return ConversationHandler.END
 
 # ===== Функции-обработчики =====
+@safe_handler()
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command."""
-    try:
-        text = (
-            'Привет! Я — бот, который помогает студентам с:\n'
-            '📚 Курсовыми\n📝 Рефератами\n📐 Контрольными\n'
-            '💡 Презентациями\n🎓 Дипломами\n👨‍🏫 Задачами\n\n'
-            'Выберите, что вам нужно:'
-        )
-        
-        if update.message:
-            await update.message.reply_text(text, reply_markup=get_main_keyboard())
-        else:
-            await update.callback_query.answer()
-            await update.callback_query.message.edit_text(text, reply_markup=get_main_keyboard())
-            
-    except Exception as e:
-        logger.error(f"Error in start command: {str(e)}", exc_info=True)
-        error_message = "Произошла ошибка. Пожалуйста, попробуйте позже."
-        if update.message:
-            await update.message.reply_text(error_message)
-        else:
-            await update.callback_query.message.reply_text(error_message)
+    text = (
+        'Привет! Я — бот, который помогает студентам с:\n'
+        '📚 Курсовыми\n📝 Рефератами\n📐 Контрольными\n'
+        '💡 Презентациями\n🎓 Дипломами\n👨‍🏫 Задачами\n\n'
+        'Выберите, что вам нужно:'
+    )
+    
+    if update.message:
+        await update.message.reply_text(text, reply_markup=get_main_keyboard())
+    else:
+        await update.callback_query.answer()
+        await update.callback_query.message.edit_text(text, reply_markup=get_main_keyboard())
 
+@safe_handler(reply_markup=MAIN_KEYBOARD)
 async def price(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show price list."""
-    try:
-        await update.callback_query.answer()
-        text = (
-            '💵 Минимальные цены:\n'
-            '— Курсовая: от 1000 ₽\n'
-            '— Реферат: от 500 ₽\n'
-            '— Контрольная: от 700 ₽\n'
-            '— Перевод: от 150 ₽/1800 знаков\n'
-            '— Презентация: от 300 ₽\n'
-            '— Дипломная: от 3000 ₽\n\n'
-            '*Цена зависит от срока, сложности и объёма*'
-        )
-        keyboard = [[InlineKeyboardButton('◀️ Назад', callback_data='back')]]
-        reply = InlineKeyboardMarkup(keyboard)
-        await update.callback_query.message.edit_text(text, parse_mode='Markdown', reply_markup=reply)
-        
-    except Exception as e:
-        logger.error(f"Error in price command: {str(e)}", exc_info=True)
-        await update.callback_query.message.reply_text(
-            "Произошла ошибка. Пожалуйста, попробуйте позже.",
-            reply_markup=get_main_keyboard()
-        )
+    await update.callback_query.answer()
+    text = (
+        '💵 Минимальные цены:\n'
+        '— Курсовая: от 1000 ₽\n'
+        '— Реферат: от 500 ₽\n'
+        '— Контрольная: от 700 ₽\n'
+        '— Перевод: от 150 ₽/1800 знаков\n'
+        '— Презентация: от 300 ₽\n'
+        '— Дипломная: от 3000 ₽\n\n'
+        '*Цена зависит от срока, сложности и объёма*'
+    )
+    await update.callback_query.message.edit_text(text, parse_mode='Markdown', reply_markup=BACK_KEYBOARD)
 
+@safe_handler(reply_markup=MAIN_KEYBOARD)
 async def orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user's orders."""
-    try:
-        session = context.bot_data['db_session']
-        user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
-        await update.callback_query.answer()
-        
-        keyboard = [[InlineKeyboardButton('◀️ Назад', callback_data='back')]]
-        reply = InlineKeyboardMarkup(keyboard)
-        
-        if not user:
-            return await update.callback_query.message.edit_text(
-                'У вас пока нет заказов.',
-                reply_markup=reply
-            )
-            
-        orders = session.query(Order).filter_by(user_id=user.id).all()
-        if not orders:
-            return await update.callback_query.message.edit_text(
-                'У вас пока нет заказов.',
-                reply_markup=reply
-            )
-            
-        text = '📥 Ваши заказы:\n\n'
-        for o in orders:
-            emoji = {
-                OrderStatus.PENDING: '⏳',
-                OrderStatus.PAID: '💰',
-                OrderStatus.IN_PROGRESS: '🔄',
-                OrderStatus.COMPLETED: '✅',
-                OrderStatus.CANCELLED: '❌'
-            }.get(o.status, '❓')
-            text += f"{emoji} Заказ #{o.id}\nТип: {o.work_type}\nЦена: {o.price} ₽\n\n"
-            
-        await update.callback_query.message.edit_text(text, reply_markup=reply)
+    # id пользователя берётся из кэша. Лишняя строка сверх размера
+    # страницы показывает, что есть следующая страница
+    page = get_page(update.callback_query.data)
+    async with context.bot_data['session_factory']() as session:
+        user_id = await get_or_create_user_id(session, update.effective_user, create=False)
+        orders = (await session.execute(
+            select(Order.id, Order.work_type, Order.price, Order.status)
+            .where(Order.user_id == user_id)
+            .order_by(Order.id.desc())
+            .offset(page * ORDERS_PAGE_SIZE)
+            .limit(ORDERS_PAGE_SIZE + 1)
+        )).all() if user_id is not None else []
+    await update.callback_query.answer()
+    
+    has_next = len(orders) > ORDERS_PAGE_SIZE
+    orders = orders[:ORDERS_PAGE_SIZE]
+    if not orders:
+        return await update.callback_query.message.edit_text(
+            'У вас пока нет заказов.',
+            reply_markup=BACK_KEYBOARD
+        )
         
-    except Exception as e:
-        logger.error(f"Error in orders command: {str(e)}", exc_info=True)
-        await update.callback_query.message.reply_text(
-            "Произошла ошибка. Пожалуйста, попробуйте позже.",
-            reply_markup=get_main_keyboard()
+    parts = ['📥 Ваши заказы:\n\n']
+    parts.extend(
+        f"{STATUS_EMOJI.get(o.status, '❓')} Заказ #{o.id}\nТип: {o.work_type}\nЦена: {o.price} ₽\n\n"
+        for o in orders
+    )
+    text = ''.join(parts)
+    
+    reply_markup = BACK_KEYBOARD
+    if page or has_next:
+        navigation = get_page_navigation(
+            'orders', page, page + 2 if has_next else page + 1,
+            prev_text="◀️ Новее", next_text="Старше ▶️"
         )
+        reply_markup = InlineKeyboardMarkup([navigation, *BACK_KEYBOARD.inline_keyboard])
+    
+    await update.callback_query.message.edit_text(text, reply_markup=reply_markup)
 
+@safe_handler(reply_markup=MAIN_KEYBOARD)
 async def support(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle support request."""
-    try:
-        await update.callback_query.answer()
-        keyboard = [[InlineKeyboardButton('◀️ Назад', callback_data='back')]]
-        reply = InlineKeyboardMarkup(keyboard)
-        await update.callback_query.message.edit_text(
-            '📞 Напишите свой вопрос, и мы ответим в течение 15–60 минут.\nПо срочным вопросам: @nocent_k  @wertszus',
-            reply_markup=reply
-        )
-        context.user_data['waiting_for_support'] = True
-        return WAITING_USER_MESSAGE
-        
-    except Exception as e:
-        logger.error(f"Error in support command: {str(e)}", exc_info=True)
-        await update.callback_query.message.reply_text(
-            "Произошла ошибка. Пожалуйста, попробуйте позже.",
-            reply_markup=get_main_keyboard()
-        )
+    await update.callback_query.answer()
+    await update.callback_query.message.edit_text(
+        '📞 Напишите свой вопрос, и мы ответим в течение 15–60 минут.\nПо срочным вопросам: @nocent_k  @wertszus',
+        reply_markup=BACK_KEYBOARD
+    )
+    context.user_data['waiting_for_support'] = True
+    return WAITING_USER_MESSAGE
 
+@safe_handler(reply_markup=MAIN_KEYBOARD)
 async def reviews(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show reviews."""
-    try:
-        session = context.bot_data['db_session']
-        recent = session.query(Review).order_by(Review.created_at.desc()).limit(5).all()
-        await update.callback_query.answer()
-        
-        keyboard = [[InlineKeyboardButton('◀️ Назад', callback_data='back')]]
-        reply = InlineKeyboardMarkup(keyboard)
-        
-        text = '📢 Последние отзывы:\n\n'
-        for r in recent:
-            u = session.query(User).filter_by(id=r.user_id).first()
-            text += f"\"{r.text}\"\n— {u.first_name if u else '-'}\n\n"
-        text += 'Хотите оставить отзыв? Напишите его в чат.'
-        
-        await update.callback_query.message.edit_text(text, reply_markup=reply)
-        return 'waiting_review'
-        
-    except Exception as e:
-        logger.error(f"Error in reviews command: {str(e)}", exc_info=True)
-        await update.callback_query.message.reply_text(
-            "Произошла ошибка. Пожалуйста, попробуйте позже.",
-            reply_markup=get_main_keyboard()
-        )
+    async with context.bot_data['session_factory']() as session:
+        recent = (await session.execute(
+            select(Review.text, User.first_name)
+            .outerjoin(User, Review.user_id == User.id)
+            .order_by(Review.created_at.desc())
+            .limit(5)
+        )).all()
+    await update.callback_query.answer()
+    
+    text = '📢 Последние отзывы:\n\n'
+    for review_text, first_name in recent:
+        text += f"\"{review_text}\"\n— {first_name or '-'}\n\n"
+    text += 'Хотите оставить отзыв? Напишите его в чат.'
+    
+    await update.callback_query.message.edit_text(text, reply_markup=BACK_KEYBOARD)
+    return 'waiting_review'
 
+@safe_handler(reply_markup=MAIN_KEYBOARD)
 async def go_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle back button."""
-    try:
-        await update.callback_query.answer()
-        text = (
-            'Привет! Я — бот, который помогает студентам с:\n'
-            '📚 Курсовыми\n📝 Рефератами\n📐 Контрольными\n'
-            '💡 Презентациями\n🎓 Дипломами\n👨‍🏫 Задачами\n\n'
-            'Выберите, что вам нужно:'
-        )
-        await update.callback_query.message.edit_text(text, reply_markup=get_main_keyboard())
-    except Exception as e:
-        logger.error(f"Error in go_back: {str(e)}", exc_info=True)
-        await update.callback_query.message.reply_text(
-            "Произошла ошибка. Пожалуйста, попробуйте позже.",
-            reply_markup=get_main_keyboard()
-        )
+    await update.callback_query.answer()
+    text = (
+        'Привет! Я — бот, который помогает студентам с:\n'
+        '📚 Курсовыми\n📝 Рефератами\n📐 Контрольными\n'
+        '💡 Презентациями\n🎓 Дипломами\n👨‍🏫 Задачами\n\n'
+        'Выберите, что вам нужно:'
+    )
+    await update.callback_query.message.edit_text(text, reply_markup=get_main_keyboard())
 
+@safe_handler()
 async def handle_support_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle support messages from users."""
-    try:
-        # Проверяем, является ли пользователь администратором
-        if update.effective_user.id == context.bot_data['admin_id']:
-            return
-            
-        # Проверяем, находится ли пользователь в процессе создания заказа
-        # или администратор устанавливает цену
-        if 'order_state' in context.user_data or context.user_data.get('current_order_id'):
-            return
-        
-        session = context.bot_data['db_session']
-        user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
-        if not user:
-            user = User(
-                telegram_id=update.effective_user.id,
-                username=update.effective_user.username,
-                first_name=update.effective_user.first_name
-            )
-            session.add(user)
-            session.commit()
+    # Проверяем, является ли пользователь администратором
+    if update.effective_user.id in context.bot_data['admin_ids']:
+        return
+        
+    # Проверяем, находится ли пользователь в процессе создания заказа
+    # или администратор устанавливает цену
+    if 'order_state' in context.user_data or context.user_data.get('current_order_id'):
+        return
+    
+    async with context.bot_data['session_factory']() as session:
+        user_id = await get_or_create_user_id(session, update.effective_user)
         
         # Сохраняем сообщение в базе данных
         msg = Message(
-            user_id=user.id,
+            user_id=user_id,
             text=update.message.text,
             is_read=False
         )
         session.add(msg)
-        session.commit()
-        
-        # Отправляем сообщение администратору
-        admin_message = (
-            f"💬 Новое сообщение от {user.first_name} (@{user.username}):\n\n"
-            f"{update.message.text}"
-        )
-        keyboard = [[InlineKeyboardButton("💬 Ответить", callback_data=f'message_user_{user.id}')]]
-        await context.bot.send_message(
+        await session.commit()
+    
+    # Отправляем сообщение администратору
+    admin_message = (
+        f"💬 Новое сообщение от {update.effective_user.first_name} (@{update.effective_user.username}):\n\n"
+        f"{update.message.text}"
+    )
+    # Сообщение уже сохранено в базе, поэтому ответ пользователю не ждёт администратора
+    results = await asyncio.gather(
+        context.bot.send_message(
             chat_id=context.bot_data['admin_id'],
             text=admin_message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-        
-        await update.message.reply_text('✅ Ваше сообщение отправлено администратору.')
-        
-    except Exception as e:
-        logger.error(f"Error in handle_support_message: {str(e)}", exc_info=True)
-        await update.message.reply_text(
-            "Произошла ошибка. Пожалуйста, попробуйте позже."
-        )
+            reply_markup=get_user_reply_keyboard(user_id)
+        ),
+        update.message.reply_text('✅ Ваше сообщение отправлено администратору.'),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error("Error sending support message notification: %s", result)
 
+@safe_handler()
 async def handle_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle user review."""
-    try:
-        session = context.bot_data['db_session']
-        user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
-        if not user:
-            user = User(
-                telegram_id=update.effective_user.id,
-                username=update.effective_user.username,
-                first_name=update.effective_user.first_name
-            )
-            session.add(user)
-            session.commit()
-            
+    async with context.bot_data['session_factory']() as session:
+        user_id = await get_or_create_user_id(session, update.effective_user)
+        
         rev = Review(
-            user_id=user.id,
+            user_id=user_id,
             text=update.message.text
         )
         session.add(rev)
-        session.commit()
-        
-        await update.message.reply_text('Спасибо! Ваш отзыв сохранён.')
-        
-    except Exception as e:
-        logger.error(f"Error in handle_review: {str(e)}", exc_info=True)
-        await update.message.reply_text(
-            "Произошла ошибка. Пожалуйста, попробуйте позже."
-        )
+        await session.commit()
+    
+    await update.message.reply_text('Спасибо! Ваш отзыв сохранён.')
 
+@safe_handler(reply_markup=MAIN_KEYBOARD)
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /help command."""
-    try:
-        text = (
-            "🤖 *Помощь по использованию бота*\n\n"
-            "📝 *Создание заказа:*\n"
-            "1. Нажмите 'Создать заказ'\n"
-            "2. Выберите тип работы\n"
-            "3. Укажите предмет и тему\n"
-            "4. Укажите объём\n"
-            "5. Укажите дедлайн\n"
-            "6. Прикрепите файл с заданием\n"
-            "7. Добавьте комментарий (если нужно)\n"
-            "8. Укажите контактную информацию\n\n"
-            "💰 *Цены:*\n"
-            "— Курсовая: от 1000 ₽\n"
-            "— Реферат: от 500 ₽\n"
-            "— Контрольная: от 700 ₽\n"
-            "— Перевод: от 150 ₽/1800 знаков\n"
-            "— Презентация: от 300 ₽\n"
-            "— Дипломная: от 3000 ₽\n\n"
-            "💬 *Поддержка:*\n"
-            "По всем вопросам обращайтесь через раздел 'Поддержка'"
-        )
-        await update.message.reply_text(text, parse_mode='Markdown', reply_markup=get_main_keyboard())
-    except Exception as e:
-        logger.error(f"Error in help_command: {str(e)}", exc_info=True)
-        await update.message.reply_text(
-            "Произошла ошибка. Пожалуйста, попробуйте позже.",
-            reply_markup=get_main_keyboard()
-        )
+    text = (
+        "🤖 *Помощь по использованию бота*\n\n"
+        "📝 *Создание заказа:*\n"
+        "1. Нажмите 'Создать заказ'\n"
+        "2. Выберите тип работы\n"
+        "3. Укажите предмет и тему\n"
+        "4. Укажите объём\n"
+        "5. Укажите дедлайн\n"
+        "6. Прикрепите файл с заданием\n"
+        "7. Добавьте комментарий (если нужно)\n"
+        "8. Укажите контактную информацию\n\n"
+        "💰 *Цены:*\n"
+        "— Курсовая: от 1000 ₽\n"
+        "— Реферат: от 500 ₽\n"
+        "— Контрольная: от 700 ₽\n"
+        "— Перевод: от 150 ₽/1800 знаков\n"
+        "— Презентация: от 300 ₽\n"
+        "— Дипломная: от 3000 ₽\n\n"
+        "💬 *Поддержка:*\n"
+        "По всем вопросам обращайтесь через раздел 'Поддержка'"
+    )
+    await update.message.reply_text(text, parse_mode='Markdown', reply_markup=get_main_keyboard())
 
+@safe_handler(reply_markup=MAIN_KEYBOARD, result=ConversationHandler.END)
 async def create_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start order creation process."""
-    try:
+    await update.callback_query.answer()
+    
+    # Инициализируем состояние заказа
+    context.user_data['order_state'] = OrderState()
+    
+    await update.callback_query.message.edit_text(
+        "Выберите тип работы:",
+        reply_markup=WORK_TYPE_KEYBOARD
+    )
+    return WAITING_WORK_TYPE
+
+@safe_handler(reply_markup=MAIN_KEYBOARD, result=ConversationHandler.END)
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Cancel current operation."""
+    if update.message:
+        await update.message.reply_text(
+            "❌ Операция отменена.",
+            reply_markup=get_main_keyboard()
+        )
+    else:
         await update.callback_query.answer()
-        
-        # Инициализируем состояние заказа
-        context.user_data['order_state'] = OrderState()
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("📚 Курсовая", callback_data='work_type_coursework'),
-                InlineKeyboardButton("📝 Реферат", callback_data='work_type_essay')
-            ],
-            [
-                InlineKeyboardButton("📐 Контрольная", callback_data='work_type_control'),
-                InlineKeyboardButton("💡 Перевод", callback_data='work_type_translation')
-            ],
-            [
-                InlineKeyboardButton("🎓 Презентация", callback_data='work_type_presentation'),
-                InlineKeyboardButton("👨‍🏫 Диплом", callback_data='work_type_diploma')
-            ],
-            [InlineKeyboardButton("📋 Задачи", callback_data='work_type_tasks')],
-            [InlineKeyboardButton("❌ Отмена", callback_data='cancel')]
-        ]
-        
         await update.callback_query.message.edit_text(
-            "Выберите тип работы:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-        return WAITING_WORK_TYPE
-        
-    except Exception as e:
-        logger.error(f"Error in create_order: {str(e)}", exc_info=True)
-        await update.callback_query.message.reply_text(
-            "Произошла ошибка. Пожалуйста, попробуйте позже.",
+            "❌ Операция отменена.",
             reply_markup=get_main_keyboard()
         )
-        return ConversationHandler.END
-
-async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Cancel current operation."""
-    try:
-        if update.message:
-            await update.message.reply_text(
-                "❌ Операция отменена.",
-                reply_markup=get_main_keyboard()
-            )
-        else:
-            await update.callback_query.answer()
-            await update.callback_query.message.edit_text(
-                "❌ Операция отменена.",
-                reply_markup=get_main_keyboard()
-            )
-        return ConversationHandler.END
-    except Exception as e:
-        logger.error(f"Error in cancel: {str(e)}", exc_info=True)
-        if update.message:
-            await update.message.reply_text(
-                "Произошла ошибка. Пожалуйста, попробуйте позже.",
-                reply_markup=get_main_keyboard()
-            )
-        else:
-            await update.callback_query.message.reply_text(
-                "Произошла ошибка. Пожалуйста, попробуйте позже.",
-                reply_markup=get_main_keyboard()
-            )
-        return ConversationHandler.END
+    return ConversationHandler.END
 
+@safe_handler("❌ Произошла ошибка при обработке платежа. Пожалуйста, попробуйте позже.", reply_markup=MAIN_KEYBOARD, result=ConversationHandler.END)
 async def handle_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle payment button click."""
-    try:
-        query = update.callback_query
-        await query.answer()
-        
-        # Получаем ID заказа из callback_data
-        order_id = int(query.data.split('_')[1])
-        session = context.bot_data['db_session']
-        
-        # Получаем заказ
-        order = session.query(Order).filter_by(id=order_id).first()
+    query = update.callback_query
+    await query.answer()
+    
+    # Получаем ID заказа из callback_data
+    order_id = int(PAYMENT_CALLBACK.match(query.data).group(1))
+    
+    async with context.bot_data['session_factory']() as session:
+        # Заказ ищем сразу вместе с проверкой владельца
+        order = await get_owned_order(session, order_id, update.effective_user)
         if not order:
             await query.message.edit_text(
-                "❌ Заказ не найден.",
-                reply_markup=get_main_keyboard()
-            )
-            return
-        
-        # Проверяем, что заказ принадлежит пользователю
-        user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
-        if not user or order.user_id != user.id:
-            await query.message.edit_text(
-                "❌ У вас нет доступа к этому заказу.",
+                "❌ Заказ не найден или у вас нет доступа.",
                 reply_markup=get_main_keyboard()
             )
             return
@@ -893,251 +1029,243 @@ async def handle_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Создаем платеж
         payment = Payment(
-            user_id=user.id,
+            user_id=order.user_id,
             order_id=order.id,
             amount=order.price,
             status=PaymentStatus.PENDING
         )
         session.add(payment)
-        session.commit()
-        
-        # Сохраняем ID заказа в контексте
-        context.user_data['current_payment_order_id'] = order.id
-        
-        # Отправляем сообщение с инструкциями по оплате
-        payment_message = (
-            f"💰 Оплата заказа #{order.id}\n\n"
-            f"Сумма к оплате: {order.price} ₽\n\n"
-            "Для оплаты:\n"
-            f"1. Переведите {order.price} ₽ на карту:\n"
-            "💳 2202 2050 0031 5959\n\n"
-            "2. После оплаты отправьте фото или скриншот чека/квитанции об оплате"
-        )
-        
-        keyboard = [[InlineKeyboardButton("❌ Отмена", callback_data='cancel')]]
-        await query.message.edit_text(
-            payment_message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-        
-        return WAITING_PAYMENT_PROOF
-        
-    except Exception as e:
-        logger.error(f"Error in handle_payment: {str(e)}", exc_info=True)
-        await query.message.edit_text(
-            "❌ Произошла ошибка при обработке платежа. Пожалуйста, попробуйте позже.",
-            reply_markup=get_main_keyboard()
-        )
-        return ConversationHandler.END
+        await session.commit()
+    
+    # Сохраняем ID заказа в контексте
+    context.user_data['current_payment_order_id'] = order.id
+    
+    # Отправляем сообщение с инструкциями по оплате
+    payment_message = (
+        f"💰 Оплата заказа #{order.id}\n\n"
+        f"Сумма к оплате: {order.price} ₽\n\n"
+        "Для оплаты:\n"
+        f"1. Переведите {order.price} ₽ на карту:\n"
+        "💳 2202 2050 0031 5959\n\n"
+        "2. После оплаты отправьте фото или скриншот чека/квитанции об оплате"
+    )
+    
+    await query.message.edit_text(
+        payment_message,
+        reply_markup=CANCEL_KEYBOARD
+    )
+    
+    return WAITING_PAYMENT_PROOF
 
+@safe_handler("❌ Произошла ошибка при обработке подтверждения оплаты. Пожалуйста, попробуйте позже.", reply_markup=MAIN_KEYBOARD, result=ConversationHandler.END)
 async def handle_payment_proof(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle payment proof upload."""
-    try:
-        if 'current_payment_order_id' not in context.user_data:
-            await update.message.reply_text(
-                "❌ Ошибка: не найден активный платеж.",
-                reply_markup=get_main_keyboard()
-            )
-            return ConversationHandler.END
-        
-        order_id = context.user_data['current_payment_order_id']
-        session = context.bot_data['db_session']
-        
-        # Получаем заказ и пользователя
-        order = session.query(Order).filter_by(id=order_id).first()
-        user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
-        
-        if not order or not user or order.user_id != user.id:
-            await update.message.reply_text(
-                "❌ Ошибка: заказ не найден или у вас нет доступа.",
-                reply_markup=get_main_keyboard()
-            )
-            return ConversationHandler.END
-        
-        # Проверяем наличие файла или фото
-        if update.message.photo:
-            file = update.message.photo[-1]  # Берем фото с максимальным разрешением
-        elif update.message.document:
-            file = update.message.document
-        else:
-            await update.message.reply_text(
-                "❌ Пожалуйста, отправьте фото или файл с подтверждением оплаты.",
-                reply_markup=get_cancel_keyboard()
-            )
-            return WAITING_PAYMENT_PROOF
-        
-        # Создаем директорию для файлов оплаты
-        payments_dir = os.path.join(os.getcwd(), 'payment_proofs')
-        if not os.path.exists(payments_dir):
-            os.makedirs(payments_dir)
-        
-        # Генерируем имя файла
-        file_id = file.file_id
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        if update.message.document:
-            file_name = f"{timestamp}_{file_id}_{file.file_name}"
-        else:
-            file_name = f"{timestamp}_{file_id}.jpg"
-        
-        file_path = os.path.join(payments_dir, file_name)
-        
-        # Скачиваем файл
-        file_info = await context.bot.get_file(file_id)
-        await file_info.download_to_drive(file_path)
-        
-        # Обновляем информацию о платеже
-        payment = session.query(Payment).filter_by(order_id=order.id).first()
-        if payment:
-            payment.proof_file = file_path
-            session.commit()
-        
-        # Отправляем подтверждение пользователю
+    if 'current_payment_order_id' not in context.user_data:
         await update.message.reply_text(
-            "✅ Подтверждение оплаты получено!\n"
-            "Администратор проверит оплату и подтвердит её в ближайшее время.",
+            "❌ Ошибка: не найден активный платеж.",
             reply_markup=get_main_keyboard()
         )
-        
-        # Уведомляем администратора
-        admin_message = (
-            f"💰 Получено подтверждение оплаты за заказ #{order.id}\n"
-            f"👤 От: {user.first_name}\n"
-            f"💵 Сумма: {order.price} ₽"
-        )
-        keyboard = [
-            [
-                InlineKeyboardButton("✅ Подтвердить оплату", callback_data=f'admin_confirm_payment_{order.id}'),
-                InlineKeyboardButton("❌ Отклонить", callback_data=f'admin_reject_payment_{order.id}')
-            ]
-        ]
-        await context.bot.send_photo(
-            chat_id=context.bot_data['admin_id'],
-            photo=file_path,
-            caption=admin_message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-        
-        # Очищаем контекст
-        del context.user_data['current_payment_order_id']
-        
         return ConversationHandler.END
-        
-    except Exception as e:
-        logger.error(f"Error in handle_payment_proof: {str(e)}", exc_info=True)
+    
+    order_id = context.user_data['current_payment_order_id']
+    
+    # Получаем заказ с проверкой владельца
+    async with context.bot_data['session_factory']() as session:
+        order = await get_owned_order(session, order_id, update.effective_user)
+    
+    if not order:
         await update.message.reply_text(
-            "❌ Произошла ошибка при обработке подтверждения оплаты. Пожалуйста, попробуйте позже.",
+            "❌ Ошибка: заказ не найден или у вас нет доступа.",
             reply_markup=get_main_keyboard()
         )
         return ConversationHandler.END
+    
+    # Проверяем наличие файла или фото
+    if update.message.photo:
+        file = update.message.photo[-1]  # Берем фото с максимальным разрешением
+    elif update.message.document:
+        file = update.message.document
+    else:
+        await update.message.reply_text(
+            "❌ Пожалуйста, отправьте фото или файл с подтверждением оплаты.",
+            reply_markup=get_cancel_keyboard()
+        )
+        return WAITING_PAYMENT_PROOF
+    
+    # Генерируем имя файла
+    file_id = file.file_id
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if update.message.document:
+        file_name = f"{timestamp}_{file_id}_{file.file_name}"
+    else:
+        file_name = f"{timestamp}_{file_id}.jpg"
+    
+    file_path = os.path.join(PAYMENTS_DIR, file_name)
+    
+    # Файл сохраняется в фоне: ответы пользователю и администратору его не ждут
+    context.application.create_task(
+        store_payment_proof(context, order.id, file_id, file_path),
+        update=update
+    )
+    
+    # Отправляем подтверждение пользователю
+    await update.message.reply_text(
+        "✅ Подтверждение оплаты получено!\n"
+        "Администратор проверит оплату и подтвердит её в ближайшее время.",
+        reply_markup=get_main_keyboard()
+    )
+    
+    # Уведомляем администратора
+    admin_message = (
+        f"💰 Получено подтверждение оплаты за заказ #{order.id}\n"
+        f"👤 От: {update.effective_user.first_name}\n"
+        f"💵 Сумма: {order.price} ₽"
+    )
+    # Файл пересылается по file_id, без повторной загрузки с диска.
+    # file_id документа нельзя отправить как фото, поэтому он уходит документом
+    if update.message.document:
+        await context.bot.send_document(
+            chat_id=context.bot_data['admin_id'],
+            document=file_id,
+            caption=admin_message,
+            reply_markup=get_payment_review_keyboard(order.id)
+        )
+    else:
+        await context.bot.send_photo(
+            chat_id=context.bot_data['admin_id'],
+            photo=file_id,
+            caption=admin_message,
+            reply_markup=get_payment_review_keyboard(order.id)
+        )
+    
+    # Очищаем контекст
+    del context.user_data['current_payment_order_id']
+    
+    return ConversationHandler.END
 
+@safe_handler("❌ Произошла ошибка при подтверждении оплаты. Пожалуйста, попробуйте позже.", reply_markup=MAIN_KEYBOARD)
 async def admin_confirm_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle admin payment confirmation."""
-    try:
-        query = update.callback_query
-        await query.answer()
-        
-        # Получаем ID заказа из callback_data
-        order_id = int(query.data.split('_')[3])
-        session = context.bot_data['db_session']
-        
-        # Получаем заказ
-        order = session.query(Order).filter_by(id=order_id).first()
-        if not order:
-            await query.message.edit_text(
-                "❌ Заказ не найден.",
-                reply_markup=get_main_keyboard()
-            )
-            return
-        
-        # Обновляем статус заказа и платежа
-        order.status = OrderStatus.PAID
-        payment = session.query(Payment).filter_by(order_id=order.id).first()
-        if payment:
-            payment.status = PaymentStatus.COMPLETED
-        session.commit()
-        
-        # Уведомляем пользователя
-        user = session.query(User).filter_by(id=order.user_id).first()
-        if user:
-            await context.bot.send_message(
-                chat_id=user.telegram_id,
-                text=f"✅ Оплата заказа #{order.id} подтверждена!\n\nМы приступим к выполнению вашего заказа.",
-                reply_markup=get_main_keyboard()
+    query = update.callback_query
+    await query.answer()
+    
+    # Получаем ID заказа из callback_data
+    order_id = int(PAYMENT_CALLBACK.match(query.data).group(1))
+    
+    async with context.bot_data['session_factory']() as session:
+        # Статусы заказа и платежа меняются UPDATE-запросами без загрузки объектов;
+        # telegram_id клиента возвращается вместе с обновлённой строкой заказа
+        telegram_id = await session.scalar(
+            sa_update(Order)
+            .where(Order.id == order_id)
+            .values(status=OrderStatus.PAID)
+            .returning(
+                select(User.telegram_id).where(User.id == Order.user_id).scalar_subquery()
             )
-        
-        # Обновляем сообщение администратора
-        await query.message.edit_caption(
-            caption=f"✅ Оплата заказа #{order.id} подтверждена",
-            reply_markup=None
         )
+        if telegram_id is None:
+            await query.message.edit_caption(
+                caption="❌ Заказ не найден.",
+                reply_markup=None
+            )
+            return
         
-    except Exception as e:
-        logger.error(f"Error in admin_confirm_payment: {str(e)}", exc_info=True)
-        await query.message.edit_text(
-            "❌ Произошла ошибка при подтверждении оплаты. Пожалуйста, попробуйте позже.",
-            reply_markup=get_main_keyboard()
+        await session.execute(
+            sa_update(Payment)
+            .where(Payment.order_id == order_id)
+            .values(status=PaymentStatus.COMPLETED)
         )
+        await session.commit()
+        invalidate_stats(context)
+    
+    # Уведомление уходит через очередь, ответ администратору не ждёт отправки
+    await context.bot_data['notify_queue'].put(dict(
+        chat_id=telegram_id,
+        text=f"✅ Оплата заказа #{order_id} подтверждена!\n\nМы приступим к выполнению вашего заказа.",
+        reply_markup=get_main_keyboard()
+    ))
+    
+    # Обновляем сообщение администратора
+    await query.message.edit_caption(
+        caption=f"✅ Оплата заказа #{order_id} подтверждена",
+        reply_markup=None
+    )
 
+@safe_handler("❌ Произошла ошибка при отклонении оплаты. Пожалуйста, попробуйте позже.", reply_markup=MAIN_KEYBOARD)
 async def admin_reject_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle admin payment rejection."""
-    try:
-        query = update.callback_query
-        await query.answer()
-        
-        # Получаем ID заказа из callback_data
-        order_id = int(query.data.split('_')[3])
-        session = context.bot_data['db_session']
-        
-        # Получаем заказ
-        order = session.query(Order).filter_by(id=order_id).first()
-        if not order:
-            await query.message.edit_text(
-                "❌ Заказ не найден.",
-                reply_markup=get_main_keyboard()
+    query = update.callback_query
+    await query.answer()
+    
+    # Получаем ID заказа из callback_data
+    order_id = int(PAYMENT_CALLBACK.match(query.data).group(1))
+    
+    async with context.bot_data['session_factory']() as session:
+        # telegram_id клиента берётся из заказа: у заказа может не быть платежа
+        telegram_id = await session.scalar(
+            select(User.telegram_id)
+            .join(Order, Order.user_id == User.id)
+            .where(Order.id == order_id)
+        )
+        if telegram_id is None:
+            await query.message.edit_caption(
+                caption="❌ Заказ не найден.",
+                reply_markup=None
             )
             return
         
-        # Обновляем статус платежа
-        payment = session.query(Payment).filter_by(order_id=order.id).first()
-        if payment:
-            payment.status = PaymentStatus.REJECTED
-        session.commit()
-        
-        # Уведомляем пользователя
-        user = session.query(User).filter_by(id=order.user_id).first()
-        if user:
-            await context.bot.send_message(
-                chat_id=user.telegram_id,
-                text=f"❌ Оплата заказа #{order.id} отклонена.\n\nПожалуйста, проверьте правильность оплаты и попробуйте снова.",
-                reply_markup=get_main_keyboard()
-            )
-        
-        # Обновляем сообщение администратора
-        await query.message.edit_caption(
-            caption=f"❌ Оплата заказа #{order.id} отклонена",
-            reply_markup=None
-        )
-        
-    except Exception as e:
-        logger.error(f"Error in admin_reject_payment: {str(e)}", exc_info=True)
-        await query.message.edit_text(
-            "❌ Произошла ошибка при отклонении оплаты. Пожалуйста, попробуйте позже.",
-            reply_markup=get_main_keyboard()
+        await session.execute(
+            sa_update(Payment)
+            .where(Payment.order_id == order_id)
+            .values(status=PaymentStatus.FAILED)
         )
+        await session.commit()
+        invalidate_stats(context)
+    
+    # Уведомление уходит через очередь, ответ администратору не ждёт отправки
+    await context.bot_data['notify_queue'].put(dict(
+        chat_id=telegram_id,
+        text=f"❌ Оплата заказа #{order_id} отклонена.\n\nПожалуйста, проверьте правильность оплаты и попробуйте снова.",
+        reply_markup=get_main_keyboard()
+    ))
+    
+    # Обновляем сообщение администратора
+    await query.message.edit_caption(
+        caption=f"❌ Оплата заказа #{order_id} отклонена",
+        reply_markup=None
+    )
 
 def main():
     """Start the bot."""
     try:
-        # Инициализация базы данных
-        db_session = init_db()
+        # Инициализация базы данных: создание таблиц и проверка соединения
+        init_db()
         logger.info("Database initialized successfully")
         
-        # Создание приложения
-        application = Application.builder().token(os.getenv('TELEGRAM_TOKEN')).build()
+        # Каталоги для загружаемых файлов
+        os.makedirs(FILES_DIR, exist_ok=True)
+        os.makedirs(PAYMENTS_DIR, exist_ok=True)
+        
+        # Создание приложения с общим пулом соединений для запросов к Bot API.
+        # HTTP/2 мультиплексирует параллельные запросы в одном TLS-соединении
+        request = HTTPXRequest(connection_pool_size=256, pool_timeout=30, http_version="2")
+        get_updates_request = HTTPXRequest(connection_pool_size=16, pool_timeout=30, http_version="2")
+        application = (
+            Application.builder()
+            .token(os.getenv('TELEGRAM_TOKEN'))
+            .request(request)
+            .get_updates_request(get_updates_request)
+            .post_init(start_notification_worker)
+            .post_stop(stop_notification_worker)
+            .build()
+        )
         
         # Сохраняем данные в bot_data
-        application.bot_data['admin_id'] = int(os.getenv('ADMIN_ID'))
-        application.bot_data['db_session'] = db_session
+        # ADMIN_ID может содержать несколько ID через запятую, первый — основной
+        admin_ids = [int(admin_id) for admin_id in os.getenv('ADMIN_ID').split(',')]
+        application.bot_data['admin_id'] = admin_ids[0]
+        application.bot_data['admin_ids'] = frozenset(admin_ids)
+        application.bot_data['session_factory'] = init_async_db()
         
         # Command handlers
         application.add_handler(CommandHandler("start", start))
@@ -1145,10 +1273,10 @@ def main():
         
         # Order conversation handler
         order_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(create_order, pattern='^create_order$')],
+            entry_points=[CallbackQueryHandler(create_order, pattern=CREATE_ORDER_PATTERN)],
             states={
                 WAITING_WORK_TYPE: [
-                    CallbackQueryHandler(handle_work_type, pattern='^work_type_'),
+                    CallbackQueryHandler(handle_work_type, pattern=WORK_TYPE_PATTERN),
                     MessageHandler(filters.TEXT & ~filters.COMMAND, handle_work_type)
                 ],
                 WAITING_SUBJECT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_subject)],
@@ -1167,17 +1295,17 @@ def main():
         logger.info("Order conversation handler added to application")
         
         # Callback query handlers для главного меню
-        application.add_handler(CallbackQueryHandler(price, pattern='^price$'))
-        application.add_handler(CallbackQueryHandler(orders, pattern='^orders$'))
-        application.add_handler(CallbackQueryHandler(support, pattern='^support$'))
-        application.add_handler(CallbackQueryHandler(reviews, pattern='^reviews$'))
-        application.add_handler(CallbackQueryHandler(go_back, pattern='^back$'))
+        application.add_handler(CallbackQueryHandler(price, pattern=PRICE_PATTERN))
+        application.add_handler(CallbackQueryHandler(orders, pattern=ORDERS_PATTERN))
+        application.add_handler(CallbackQueryHandler(support, pattern=SUPPORT_PATTERN))
+        application.add_handler(CallbackQueryHandler(reviews, pattern=REVIEWS_PATTERN))
+        application.add_handler(CallbackQueryHandler(go_back, pattern=BACK_PATTERN))
         
         # Admin handlers
         admin_conv = ConversationHandler(
             entry_points=[
                 CommandHandler("admin", admin_panel),
-                CallbackQueryHandler(admin_accept_order, pattern='^admin_accept_')
+                CallbackQueryHandler(admin_accept_order, pattern=ADMIN_ACCEPT_PATTERN)
             ],
             states={
                 WAITING_BROADCAST: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_broadcast)],
@@ -1190,23 +1318,23 @@ def main():
         application.add_handler(admin_conv)
         
         # Admin callback handlers
-        application.add_handler(CallbackQueryHandler(admin_stats, pattern='^admin_stats$'))
-        application.add_handler(CallbackQueryHandler(admin_new_orders, pattern='^admin_new_orders$'))
-        application.add_handler(CallbackQueryHandler(admin_reject_order, pattern='^admin_reject_'))
-        application.add_handler(CallbackQueryHandler(admin_broadcast, pattern='^admin_broadcast$'))
-        application.add_handler(CallbackQueryHandler(admin_reviews, pattern='^admin_reviews$'))
-        application.add_handler(CallbackQueryHandler(admin_review_response, pattern='^admin_review_response_'))
-        application.add_handler(CallbackQueryHandler(admin_messages, pattern='^admin_messages$'))
-        application.add_handler(CallbackQueryHandler(admin_message_response, pattern='^admin_message_response_'))
+        application.add_handler(CallbackQueryHandler(admin_stats, pattern=ADMIN_STATS_PATTERN))
+        application.add_handler(CallbackQueryHandler(admin_new_orders, pattern=ADMIN_NEW_ORDERS_PATTERN))
+        application.add_handler(CallbackQueryHandler(admin_reject_order, pattern=ADMIN_REJECT_PATTERN))
+        application.add_handler(CallbackQueryHandler(admin_broadcast, pattern=ADMIN_BROADCAST_PATTERN))
+        application.add_handler(CallbackQueryHandler(admin_reviews, pattern=ADMIN_REVIEWS_PATTERN))
+        application.add_handler(CallbackQueryHandler(admin_review_response, pattern=ADMIN_REVIEW_RESPONSE_PATTERN))
+        application.add_handler(CallbackQueryHandler(admin_messages, pattern=ADMIN_MESSAGES_PATTERN))
+        application.add_handler(CallbackQueryHandler(admin_message_response, pattern=ADMIN_MESSAGE_RESPONSE_PATTERN))
         
         # Payment handlers
-        application.add_handler(CallbackQueryHandler(handle_payment, pattern='^pay_'))
+        application.add_handler(CallbackQueryHandler(handle_payment, pattern=PAY_PATTERN))
         application.add_handler(MessageHandler(
             filters.PHOTO | filters.Document.ALL,
             handle_payment_proof
         ))
-        application.add_handler(CallbackQueryHandler(admin_confirm_payment, pattern='^admin_confirm_payment_'))
-        application.add_handler(CallbackQueryHandler(admin_reject_payment, pattern='^admin_reject_payment_'))
+        application.add_handler(CallbackQueryHandler(admin_confirm_payment, pattern=ADMIN_CONFIRM_PAYMENT_PATTERN))
+        application.add_handler(CallbackQueryHandler(admin_reject_payment, pattern=ADMIN_REJECT_PAYMENT_PATTERN))
         
         # Общий обработчик сообщений (должен быть последним)
         application.add_handler(MessageHandler(
@@ -1215,14 +1343,36 @@ def main():
             block=False
         ))
         
+        # Фоновая отправка рассылок из очереди в базе данных
+        application.job_queue.run_repeating(
+            process_broadcasts,
+            interval=BROADCAST_BATCH_INTERVAL,
+            first=BROADCAST_BATCH_INTERVAL
+        )
+        
+        # Обслуживание SQLite: статистика планировщика и размер WAL
+        application.job_queue.run_repeating(optimize_database, interval=DB_OPTIMIZE_INTERVAL)
+        application.job_queue.run_repeating(checkpoint_database, interval=WAL_CHECKPOINT_INTERVAL)
+        
         # Запуск бота
         logger.info("Starting bot...")
-        application.run_polling()
+        # Если задан WEBHOOK_URL, обновления принимаются через вебхук, иначе — polling
+        webhook_url = os.getenv('WEBHOOK_URL')
+        if webhook_url:
+            application.run_webhook(
+                listen='0.0.0.0',
+                port=int(os.getenv('WEBHOOK_PORT', '8443')),
+                url_path=urlparse(webhook_url).path.lstrip('/'),
+                webhook_url=webhook_url,
+                secret_token=os.getenv('WEBHOOK_SECRET')
+            )
+        else:
+            application.run_polling()
         
     except Exception as e:
-        logger.error(f"Error in main: {str(e)}", exc_info=True)
+        logger.error("Error in main: %s", e, exc_info=True)
     finally:
-        db_session.close()
+        log_listener.stop()
 
 if __name__ == '__main__':
     main()
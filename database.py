@@ -1,18 +1,41 @@
 from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Enum as SQLEnum, Text, Boolean, Index
 from sqlalchemy.orm import sessionmaker, relationship, DeclarativeBase
-from datetime import datetime
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import enum
 import os
 import logging
-from sqlalchemy import text
+from sqlalchemy import event, func, text
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
 
 # Константы
 DATABASE_URL = "sqlite:///bot_new.db"
+ASYNC_DATABASE_URL = DATABASE_URL.replace('sqlite://', 'sqlite+aiosqlite://', 1)
 DATABASE_DIR = os.path.dirname(DATABASE_URL.replace('sqlite:///', ''))
 
+# Текущее локальное время, вычисляемое SQLite в самом запросе INSERT/UPDATE
+DB_NOW = func.datetime('now', 'localtime')
+
+# PRAGMA для каждого нового соединения SQLite
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Включает WAL и настраивает кэш для нового соединения."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
 # Создаем базовый класс для моделей
 class Base(DeclarativeBase):
     pass
@@ -30,6 +53,11 @@ class PaymentStatus(enum.Enum):
     FAILED = "failed"
     REFUNDED = "refunded"
 
+class BroadcastStatus(enum.Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
 class User(Base):
     __tablename__ = 'users'
     
@@ -38,7 +66,7 @@ class User(Base):
     username = Column(String(255), index=True)
     first_name = Column(String(255))
     last_name = Column(String(255))
-    created_at = Column(DateTime, default=datetime.now, index=True)
+    created_at = Column(DateTime, default=DB_NOW, index=True)
     
     # Отношения
     orders = relationship("Order", back_populates="user", cascade="all, delete-orphan")
@@ -60,12 +88,23 @@ class Order(Base):
     file_path = Column(String(255))
     comment = Column(Text)
     contact_info = Column(String(255))
-    created_at = Column(DateTime, default=datetime.now, index=True)
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    created_at = Column(DateTime, default=DB_NOW, index=True)
+    updated_at = Column(DateTime, default=DB_NOW, onupdate=DB_NOW)
     
     # Отношения
     user = relationship("User", back_populates="orders")
     payments = relationship("Payment", back_populates="order", cascade="all, delete-orphan")
+    
+    # Частичный индекс для списка новых заказов в админ-панели
+    __table_args__ = (
+        Index(
+            'ix_order_status_pending', 'status',
+            sqlite_where=text("status = 'PENDING'"),
+            postgresql_where=text("status = 'PENDING'")
+        ),
+        # Заказы пользователя по статусу в порядке создания
+        Index('ix_order_user_status_created', 'user_id', 'status', 'created_at'),
+    )
 
 class Payment(Base):
     __tablename__ = 'payments'
@@ -77,13 +116,18 @@ class Payment(Base):
     status = Column(SQLEnum(PaymentStatus), default=PaymentStatus.PENDING, index=True)
     payment_method = Column(String(50))
     transaction_id = Column(String(255), unique=True)
-    created_at = Column(DateTime, default=datetime.now, index=True)
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    created_at = Column(DateTime, default=DB_NOW, index=True)
+    updated_at = Column(DateTime, default=DB_NOW, onupdate=DB_NOW)
     proof_file = Column(String)  # Путь к файлу подтверждения оплаты
     
     # Отношения
     user = relationship("User", back_populates="payments")
     order = relationship("Order", back_populates="payments")
+    
+    # Поиск платежа заказа в обработчиках оплаты
+    __table_args__ = (
+        Index('ix_payment_order_status', 'order_id', 'status'),
+    )
 
 class Message(Base):
     __tablename__ = 'messages'
@@ -93,11 +137,16 @@ class Message(Base):
     text = Column(Text, nullable=False)
     admin_response = Column(Text)
     is_read = Column(Boolean, default=False, index=True)
-    created_at = Column(DateTime, default=datetime.now, index=True)
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    created_at = Column(DateTime, default=DB_NOW, index=True)
+    updated_at = Column(DateTime, default=DB_NOW, onupdate=DB_NOW)
     
     # Отношения
     user = relationship("User", back_populates="messages")
+    
+    # Непрочитанные сообщения пользователя
+    __table_args__ = (
+        Index('ix_message_user_isread', 'user_id', 'is_read'),
+    )
 
 class Review(Base):
     __tablename__ = 'reviews'
@@ -107,14 +156,51 @@ class Review(Base):
     text = Column(Text, nullable=False)
     rating = Column(Integer, index=True)
     admin_response = Column(Text)
-    created_at = Column(DateTime, default=datetime.now, index=True)
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    created_at = Column(DateTime, default=DB_NOW, index=True)
+    updated_at = Column(DateTime, default=DB_NOW, onupdate=DB_NOW)
     
     # Отношения
     user = relationship("User", back_populates="reviews")
 
+class BroadcastJob(Base):
+    __tablename__ = 'broadcast_jobs'
+    
+    id = Column(Integer, primary_key=True)
+    text = Column(Text, nullable=False)
+    chat_id = Column(Integer)     # Чат администратора для отчёта о ходе рассылки
+    message_id = Column(Integer)  # Сообщение с отчётом, которое обновляется
+    is_completed = Column(Boolean, default=False, index=True)
+    created_at = Column(DateTime, default=DB_NOW, index=True)
+    completed_at = Column(DateTime)
+    
+    # Отношения
+    recipients = relationship("BroadcastRecipient", back_populates="job", cascade="all, delete-orphan")
+
+class BroadcastRecipient(Base):
+    __tablename__ = 'broadcast_recipients'
+    
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey('broadcast_jobs.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    status = Column(SQLEnum(BroadcastStatus), default=BroadcastStatus.PENDING)
+    attempts = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=DB_NOW, onupdate=DB_NOW)
+    
+    # Отношения
+    job = relationship("BroadcastJob", back_populates="recipients")
+    user = relationship("User")
+    
+    # Выборка очередной пачки получателей рассылки
+    __table_args__ = (
+        Index('ix_broadcast_recipient_job_status', 'job_id', 'status', 'id'),
+    )
+
 def init_db():
-    """Initialize database connection and create tables."""
+    """Initialize database, create tables and return a session factory.
+    
+    Callers open short-lived sessions from the factory
+    (``with Session() as session:``) instead of sharing one session.
+    """
     try:
         logger.info("Initializing database...")
         logger.info(f"Database URL: {DATABASE_URL}")
@@ -128,32 +214,65 @@ def init_db():
         logger.info("Creating database engine...")
         engine = create_engine(
             DATABASE_URL,
+            poolclass=QueuePool,
+            pool_size=10,
+            max_overflow=20,
+            pool_timeout=30,
+            pool_use_lifo=True,  # Сначала берём недавно использованные соединения
             pool_pre_ping=True,  # Проверка соединения перед использованием
             pool_recycle=3600,   # Переподключение каждый час
+            query_cache_size=1200,  # Кэш скомпилированных запросов
             connect_args={'check_same_thread': False}  # Разрешаем многопоточность
         )
+        event.listen(engine, "connect", set_sqlite_pragmas)
         
         # Create tables if they don't exist
         logger.info("Creating database tables...")
         Base.metadata.create_all(engine)
         
-        # Create session
-        logger.info("Creating database session...")
+        # create_all не добавляет новые индексы в уже существующие таблицы
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(engine, checkfirst=True)
+        
+        # Create session factory
+        logger.info("Creating database session factory...")
         Session = sessionmaker(
             bind=engine,
             expire_on_commit=False,  # Предотвращаем истечение срока действия объектов после коммита
             autocommit=False,        # Явный контроль транзакций
             autoflush=False         # Отключаем автоматический flush
         )
-        session = Session()
         
         # Test connection
         logger.info("Testing database connection...")
-        session.execute(text("SELECT 1"))
+        with Session() as session:
+            session.execute(text("SELECT 1"))
         logger.info("Database connection successful!")
         
-        return session
+        return Session
         
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}", exc_info=True)
-        raise 
\ No newline at end of file
+        raise 
+
+def init_async_db():
+    """Create async engine and return a session factory for handlers."""
+    logger.info(f"Creating async database engine: {ASYNC_DATABASE_URL}")
+    engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=AsyncAdaptedQueuePool,  # aiosqlite по умолчанию не переиспользует соединения
+        pool_size=20,
+        max_overflow=40,
+        pool_timeout=30,
+        pool_use_lifo=True,  # Сначала берём недавно использованные соединения
+        pool_pre_ping=True,  # Проверка соединения перед использованием
+        pool_recycle=1800,   # Переподключение каждые полчаса
+        query_cache_size=1200  # Кэш скомпилированных запросов
+    )
+    event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    return async_sessionmaker(
+        engine,
+        expire_on_commit=False,  # Объекты остаются доступными после коммита
+        autoflush=False
+    )
\ No newline at end of file
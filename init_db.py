@@ -37,14 +37,15 @@ def init_test_data(session):
 
 if __name__ == "__main__":
     print("Инициализация базы данных...")
-    session = init_db()
+    Session = init_db()
     
-    # Проверяем создание таблиц
-    print("\nПроверка таблиц:")
-    for table in session.execute(text("SELECT name FROM sqlite_master WHERE type='table'")).fetchall():
-        print(f"- {table[0]}")
-    
-    # Создаем тестовые данные
-    init_test_data(session)
+    with Session() as session:
+        # Проверяем создание таблиц
+        print("\nПроверка таблиц:")
+        for table in session.execute(text("SELECT name FROM sqlite_master WHERE type='table'")).fetchall():
+            print(f"- {table[0]}")
+        
+        # Создаем тестовые данные
+        init_test_data(session)
     
     print("\nБаза данных успешно создана!") 
\ No newline at end of file